@@ -0,0 +1,266 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Ensure project root is on sys.path when executed from app/
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from spatial.benchmark import (
+    bench_batched,
+    bench_requests,
+    bench_single,
+    peak_rss_mb,
+    synthetic_images,
+    synthetic_model,
+)
+from spatial.inference import load_model, warmup_model
+
+SCENARIOS = ("single", "batched", "flask")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the single-image, batched and Flask inference paths."
+    )
+    parser.add_argument(
+        "--model",
+        type=Path,
+        default=None,
+        help="Weights to benchmark (.pt/.onnx). Default: an untrained synthetic model.",
+    )
+    parser.add_argument(
+        "--images",
+        type=Path,
+        default=None,
+        help="Folder of .jpg images. Default: a fixed synthetic image set.",
+    )
+    parser.add_argument("--count", type=int, default=32, help="Images in the benchmark set.")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the set per path.")
+    parser.add_argument(
+        "--scenarios",
+        type=str,
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated subset of {', '.join(SCENARIOS)}.",
+    )
+    parser.add_argument("--img-size", type=int, default=416)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Concurrent clients for the Flask path (exercises micro-batching).",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=Path("outputs/benchmark"),
+        help="Synthetic data and annotated outputs.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("outputs/benchmark/results.json"),
+        help="Where to save the JSON report.",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        default=None,
+        help="Previous JSON report to compare against.",
+    )
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.45)
+    return parser.parse_args()
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def bench_flask(model_path: Path, images, concurrency: int):
+    """
+    Posts every image once to `/predict` through the Flask test client (no
+    network). Images are distinct, so the prediction cache never answers.
+    Latency is per request on the client side; the stage breakdown comes
+    from the server's own timings (`GET /metrics`).
+    """
+    os.environ["SPATIAL_MODEL_PATH"] = str(model_path)
+    import app_flask
+
+    def _send(payload: bytes) -> None:
+        client = app_flask.app.test_client()
+        response = client.post(
+            "/predict",
+            data={"image": (io.BytesIO(payload), "image.jpg")},
+            content_type="multipart/form-data",
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}: {response.get_json()}")
+
+    def _server_timings() -> dict:
+        return app_flask.app.test_client().get("/metrics").get_json().get("timings", {})
+
+    payloads = [Path(p).read_bytes() for p in images]
+    _send(payloads[0])  # warm-up outside the measurement
+    baseline_rss = peak_rss_mb()
+    report = bench_requests(
+        _send,
+        payloads[1:] or payloads,
+        concurrency=concurrency,
+        server_timings=_server_timings,
+    )
+    report["baseline_rss_mb"] = baseline_rss
+    report["batcher"] = {
+        key: value for key, value in app_flask.batcher.stats().items() if key != "timings"
+    }
+    return report
+
+
+def run_scenario(name: str, model_path: Path, images, args: argparse.Namespace) -> dict:
+    """
+    Runs one scenario, model load and warm-up included. Called in a fresh
+    process per scenario, so its peak RSS is that scenario's alone;
+    `baseline_rss_mb` is the peak before the measured run (model loaded).
+    """
+    if name == "flask":
+        return bench_flask(model_path, images, args.concurrency)
+
+    t0 = time.perf_counter()
+    model = load_model(model_path)
+    t1 = time.perf_counter()
+    warmup_model(model, args.img_size)
+    t2 = time.perf_counter()
+    baseline_rss = peak_rss_mb()
+
+    if name == "single":
+        report = bench_single(
+            model,
+            images,
+            args.work_dir / "single",
+            conf=args.conf,
+            iou=args.iou,
+            repeat=args.repeat,
+        )
+    else:
+        report = bench_batched(
+            model,
+            images,
+            args.work_dir / "batched",
+            conf=args.conf,
+            iou=args.iou,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            repeat=args.repeat,
+        )
+    report.update(load_seconds=t1 - t0, warmup_seconds=t2 - t1, baseline_rss_mb=baseline_rss)
+    return report
+
+
+def _print_report(name: str, report: dict, baseline: dict = None) -> None:
+    latency = report["latency_ms"]
+    line = (
+        f"[{name}] {report['images_per_sec']:.1f} images/sec | "
+        f"p50 {latency['p50']:.1f} ms  p95 {latency['p95']:.1f} ms  p99 {latency['p99']:.1f} ms"
+    )
+    if report.get("peak_rss_mb") is not None:
+        line += f" | peak RSS {report['peak_rss_mb']:.0f} MB"
+        if report.get("baseline_rss_mb") is not None:
+            line += f" (+{report['peak_rss_mb'] - report['baseline_rss_mb']:.0f} MB during run)"
+    print(line)
+    if "stages_ms" in report:
+        print(
+            "    stages (ms/image): "
+            + ", ".join(f"{stage} {ms:.2f}" for stage, ms in report["stages_ms"].items())
+        )
+    if baseline:
+        speedup = report["images_per_sec"] / max(baseline["images_per_sec"], 1e-9)
+        p95_ratio = latency["p95"] / max(baseline["latency_ms"]["p95"], 1e-9)
+        print(f"    vs baseline: throughput x{speedup:.2f}, p95 x{p95_ratio:.2f}")
+
+
+def main() -> None:
+    args = parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.images:
+        images = sorted(args.images.glob("*.jpg"))[: args.count]
+        if not images:
+            raise SystemExit(f"No images found in {args.images}")
+    else:
+        images = synthetic_images(args.work_dir / "images", count=args.count)
+    model_path = args.model or synthetic_model(
+        args.work_dir / "synthetic.pt", imgsz=args.img_size
+    )
+
+    # One fresh process per scenario: peak RSS is a process-wide high-water
+    # mark, and the Flask app loads its own model on import
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in (s for s in SCENARIOS if s in scenarios):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(run_scenario, name, model_path, images, args).result()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "model": str(model_path),
+            "synthetic_model": args.model is None,
+            "images": len(images),
+            "repeat": args.repeat,
+            "img_size": args.img_size,
+            "batch_size": args.batch_size,
+            "concurrency": args.concurrency,
+            "conf": args.conf,
+            "iou": args.iou,
+        },
+        "scenarios": results,
+    }
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+        baseline = previous.get("scenarios", {})
+        print(f"Baseline: {args.compare} (commit {previous.get('commit', '?')})")
+
+    for name, scenario in results.items():
+        _print_report(name, scenario, baseline.get(name))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
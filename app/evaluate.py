@@ -0,0 +1,68 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path when executed from app/
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from spatial.evaluation import DEFAULT_SWEEP, evaluate_table, format_report
+from spatial.results import DetectionTable
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Evaluate a detection table saved by run_inference.py --detections: "
+            "confusion matrix, per-class metrics, calibration and conf sweep."
+        )
+    )
+    parser.add_argument(
+        "--detections",
+        type=Path,
+        required=True,
+        help="Table saved by run_inference.py --detections (.npz or .parquet).",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=str,
+        default=",".join(str(t) for t in DEFAULT_SWEEP),
+        help="Comma-separated confidence thresholds to sweep.",
+    )
+    parser.add_argument("--bins", type=int, default=10, help="Calibration bins.")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Optional path to save the full report as JSON.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    table = DetectionTable.load(args.detections)
+    report = evaluate_table(table, thresholds, bins=args.bins)
+
+    summary = report["summary"]
+    print(
+        f"{summary['total_images']} images, {len(table.detections)} detections "
+        f"({summary['verifiable']} with ground truth)"
+    )
+    if summary["errors"]:
+        print(f"{summary['errors']} unreadable images left out")
+    for line in format_report(report):
+        print(line)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
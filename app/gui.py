@@ -14,7 +14,14 @@ if str(ROOT) not in sys.path:
 from PIL import Image, ImageTk
 
 from spatial.data import CLASS_NAMES
-from spatial.inference import download_image, evaluate_batch, load_model, predict_image
+from spatial.fetch import url_stem
+from spatial.inference import (
+    ANNOTATE_LIMIT,
+    ModelManager,
+    PredictionCache,
+    download_bytes,
+    evaluate_batch,
+)
 
 
 def parse_args() -> argparse.Namespace:
@@ -51,7 +58,9 @@ class SpatialApp:
         self.root = root
         self.args = args
         self.model_path = args.model
-        self.model = load_model(self.model_path)
+        self.models = ModelManager(capacity=3)
+        self.models.swap(self.model_path)
+        self.cache = PredictionCache(max_entries=512)
         self.output_dir = args.output_dir
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.image_label = None
@@ -133,29 +142,48 @@ class SpatialApp:
         self.log_var.set("\n".join(lines))
 
     def _predict_path(self, path: Path) -> None:
-        self._set_status(f"Analyse de {path.name}...")
-        out_path, dets = predict_image(
-            self.model,
-            path,
-            self.output_dir,
+        self._predict_source(path, path.stem)
+
+    def _predict_source(self, source, name: str) -> None:
+        self._set_status(f"Analyse de {name}...")
+        # Images deja analysees avec ce modele : resultat servi par le cache.
+        # Modele et identifiant lus ensemble (une bascule peut etre en cours)
+        model, model_id = self.models.snapshot()
+        encoded, dets = self.cache.predict(
+            model,
+            source,
+            model_id,
             conf=0.25,
             iou=0.45,
         )
+        out_path = self.output_dir / f"{name}_pred.jpg"
+        out_path.write_bytes(encoded)
         self._show_image(out_path)
         self._log_detections(dets)
         self._set_status("Termine.")
 
     def _pick_model(self):
         path = filedialog.askopenfilename(
-            title="Choisir un modele (.pt)",
-            filetypes=[("PyTorch weights", "*.pt")],
+            title="Choisir un modele (.pt / .onnx)",
+            filetypes=[("PyTorch weights", "*.pt"), ("ONNX export", "*.onnx")],
         )
-        if path:
+        if not path:
+            return
+
+        def _task():
+            # Chargement hors du thread Tk ; les modeles deja vus restent en cache
             self._set_status("Chargement du modele...")
+            try:
+                self.models.swap(Path(path))
+            except Exception as exc:
+                self._set_status(f"Echec du chargement: {exc}")
+                return
             self.model_path = Path(path)
-            self.model = load_model(self.model_path)
             self.model_var.set(f"Modele: {self.model_path}")
             self._set_status("Modele charge.")
+
+        self._run_threaded(_task)
+
     def _run_threaded(self, target, *args):
         thread = threading.Thread(target=target, args=args, daemon=True)
         thread.start()
@@ -184,11 +212,11 @@ class SpatialApp:
         def _task():
             self._set_status("Telechargement en cours...")
             try:
-                img_path = download_image(url)
+                img_bytes = download_bytes(url)
             except Exception as exc:
                 self._set_status(f"Echec du telechargement: {exc}")
                 return
-            self._predict_path(img_path)
+            self._predict_source(img_bytes, url_stem(url))
 
         self._run_threaded(_task)
 
@@ -209,25 +237,32 @@ class SpatialApp:
         def _task():
             self._set_status(f"Batch de {len(sampled)} images...")
             label_dir = self.args.dataset_labels if self.args.dataset_labels.exists() else None
+            annotate = "sync" if len(sampled) <= ANNOTATE_LIMIT else "none"
             summary = evaluate_batch(
-                self.model,
+                self.models.current,
                 sampled,
                 save_dir=self.output_dir,
                 label_dir=label_dir,
                 conf=0.25,
                 iou=0.45,
+                annotate=annotate,
             )
 
             lines = [
                 f"Images: {summary['total_images']}",
+                f"Illisibles: {summary['errors']}",
                 f"Detection rate: {summary['detection_rate']:.1f}%",
+                f"Debit: {summary['images_per_sec']:.1f} images/s",
             ]
             if label_dir:
                 lines.append(f"Accuracy: {summary['accuracy']:.2f}%")
             lines.append("Repartition:")
             for cid, count in summary["counts"].items():
                 lines.append(f"- {CLASS_NAMES.get(cid, cid)}: {count}")
-            lines.append(f"Outputs: {summary['output_dir']}")
+            if annotate == "none":
+                lines.append("Outputs: statistiques uniquement")
+            else:
+                lines.append(f"Outputs: {summary['output_dir']}")
             self.log_var.set("\n".join(lines))
             self._set_status("Batch termine.")
 
@@ -0,0 +1,149 @@
+import argparse
+import random
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path when executed from app/
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from spatial.inference import evaluate_batch, load_model, warmup_model
+from spatial.quantize import QUANT_MODES, float_model_path, quantize_model
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Quantize a Spatial model to INT8 and compare it with the original."
+    )
+    parser.add_argument(
+        "--model",
+        type=Path,
+        default=Path("models/galaxy_model_v2_expert.pt"),
+        help="Weights to quantize (.pt or .onnx).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Quantized model path (default: models/<name>_int8.onnx).",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=QUANT_MODES,
+        default="static",
+        help="static: weights + activations, calibrated on val images; dynamic: weights only.",
+    )
+    parser.add_argument(
+        "--folder",
+        type=Path,
+        default=Path("data/processed/galaxy_expert/val/images"),
+        help="Validation images (from prepare_dataset) for calibration and evaluation.",
+    )
+    parser.add_argument(
+        "--labels",
+        type=Path,
+        default=Path("data/processed/galaxy_expert/val/labels"),
+        help="Label directory aligned with --folder.",
+    )
+    parser.add_argument(
+        "--calibration-size",
+        type=int,
+        default=100,
+        help="Validation images used to calibrate activation ranges (static mode).",
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=300,
+        help="Validation images (disjoint from calibration) used for the comparison.",
+    )
+    parser.add_argument("--img-size", type=int, default=416)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.45)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    output = args.output or args.model.with_name(f"{args.model.stem}_int8.onnx")
+
+    images = sorted(args.folder.glob("*.jpg"))
+    if not images:
+        raise SystemExit(f"No images found in {args.folder}")
+    # Dynamic quantization needs no calibration: every sampled image evaluates
+    calibration_size = args.calibration_size if args.mode == "static" else 0
+    if len(images) <= calibration_size:
+        raise SystemExit(
+            f"Only {len(images)} images in {args.folder}: none left for the comparison "
+            f"after {calibration_size} calibration images (lower --calibration-size)"
+        )
+    rng = random.Random(args.seed)
+    sampled = rng.sample(images, k=min(len(images), calibration_size + args.count))
+    calibration = sampled[:calibration_size]
+    evaluation = sampled[calibration_size:]
+
+    quantize_model(
+        args.model,
+        output,
+        calibration_images=calibration,
+        imgsz=args.img_size,
+        mode=args.mode,
+    )
+    print(f"Quantized model ({args.mode}) written to {output}")
+
+    # INT8 is compared with the FP32 ONNX model it was quantized from, so the
+    # gain is that of quantization alone, not of switching runtime
+    candidates = {"original": args.model, "fp32": float_model_path(args.model, output)}
+    if candidates["fp32"] == args.model:
+        del candidates["original"]
+    candidates["int8"] = output
+
+    label_dir = args.labels if args.labels.exists() else None
+    summaries = {}
+    for name, path in candidates.items():
+        model = load_model(path)
+        # Keep one-off predictor setup out of the throughput comparison
+        warmup_model(model, args.img_size)
+        summaries[name] = evaluate_batch(
+            model,
+            evaluation,
+            save_dir=Path("outputs/quantize") / name,
+            label_dir=label_dir,
+            conf=args.conf,
+            iou=args.iou,
+            batch_size=args.batch_size,
+            imgsz=args.img_size,
+            annotate="none",
+        )
+
+    original, quantized = summaries["fp32"], summaries["int8"]
+    size_before = candidates["fp32"].stat().st_size / 1e6
+    size_after = output.stat().st_size / 1e6
+    print(f"Evaluated on {quantized['total_images']} validation images (FP32 ONNX -> INT8)")
+    if "original" in summaries:
+        print(
+            f"Original {args.model.name}: {summaries['original']['images_per_sec']:.1f} images/sec"
+        )
+    print(
+        f"Throughput: {original['images_per_sec']:.1f} -> "
+        f"{quantized['images_per_sec']:.1f} images/sec "
+        f"(x{quantized['images_per_sec'] / max(original['images_per_sec'], 1e-9):.2f})"
+    )
+    print(f"Model size: {size_before:.1f} MB -> {size_after:.1f} MB")
+    if quantized["verifiable"]:
+        delta = quantized["accuracy"] - original["accuracy"]
+        print(
+            f"Accuracy: {original['accuracy']:.2f}% -> {quantized['accuracy']:.2f}% "
+            f"({delta:+.2f} pts)"
+        )
+    print(
+        f"Detection rate: {original['detection_rate']:.1f}% -> "
+        f"{quantized['detection_rate']:.1f}%"
+    )
+
+
+if __name__ == "__main__":
+    main()
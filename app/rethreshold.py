@@ -0,0 +1,165 @@
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path when executed from app/
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from spatial.data import CLASS_NAMES
+from spatial.evaluation import evaluate_table, format_report
+from spatial.inference import load_model
+from spatial.scores import STORE_CONF, ScoreStore, model_digest, rethreshold
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Batch stats for several conf / iou settings from stored raw scores. "
+            "Images missing from the store are predicted once; later runs only "
+            "re-apply the thresholds."
+        )
+    )
+    parser.add_argument(
+        "--model",
+        type=Path,
+        default=Path("models/galaxy_model_v2_expert.pt"),
+        help="Weights whose scores are used (identified by their SHA-256).",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=Path("outputs/scores"),
+        help="Score store directory (one table per model).",
+    )
+    parser.add_argument(
+        "--folder",
+        type=Path,
+        default=Path("data/processed/galaxy_expert/val/images"),
+        help="Folder of .jpg images to evaluate.",
+    )
+    parser.add_argument(
+        "--labels",
+        type=Path,
+        default=Path("data/processed/galaxy_expert/val/labels"),
+        help="Ground truth labels folder (optional).",
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=0,
+        help="Random sample of images from --folder (0 for all of them).",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Sampling seed; keep it fixed so later runs hit the store.",
+    )
+    parser.add_argument(
+        "--conf",
+        type=str,
+        default="0.25",
+        help=f"Comma-separated confidence thresholds (>= {STORE_CONF}).",
+    )
+    parser.add_argument(
+        "--iou",
+        type=str,
+        default="0.45",
+        help="Comma-separated NMS IoU thresholds.",
+    )
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Also print the full evaluation (confusion matrix, per-class metrics...) per setting.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Optional path to save the results as JSON.",
+    )
+    return parser.parse_args()
+
+
+def _floats(spec: str):
+    return [float(v) for v in spec.split(",") if v.strip()]
+
+
+def main() -> None:
+    args = parse_args()
+    confs, ious = _floats(args.conf), _floats(args.iou)
+    if min(confs) < STORE_CONF:
+        raise SystemExit(f"--conf below the stored threshold ({STORE_CONF}) cannot be recomputed.")
+
+    images = sorted(Path(args.folder).glob("*.jpg"))
+    if not images:
+        raise SystemExit(f"No images found in {args.folder}")
+    if 0 < args.count < len(images):
+        images = random.Random(args.seed).sample(images, k=args.count)
+    label_dir = args.labels if args.labels.exists() else None
+
+    store = ScoreStore(args.store)
+    digest = model_digest(args.model)
+    start = time.perf_counter()
+    # The model is only loaded when some images have no stored scores yet
+    model = load_model(args.model) if store.missing(digest, images) else None
+    collected = store.collect(
+        model,
+        digest,
+        images,
+        label_dir=label_dir,
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+    )
+    loaded = time.perf_counter()
+    print(
+        f"{len(images)} images: {collected['stored']} from the store, "
+        f"{collected['predicted']} predicted ({loaded - start:.1f}s) -> {store.path(digest)}"
+    )
+    if collected["failed"]:
+        print(f"{collected['failed']} unreadable images skipped (retried on the next run)")
+
+    results = []
+    for iou in ious:
+        # NMS once per iou; higher confidences only filter its output
+        suppressed = rethreshold(collected["table"], min(confs), iou)
+        for conf in confs:
+            table = suppressed.filter(conf)
+            # Top-1 statistics only: secondary boxes are approximate (see rethreshold)
+            row = {"conf": conf, "iou": iou}
+            row.update(table.summary())
+            if args.metrics:
+                row["report"] = evaluate_table(table, [conf])
+            results.append(row)
+    elapsed = time.perf_counter() - loaded
+
+    print(f"{'conf':>6}{'iou':>6}{'detected %':>12}{'accuracy %':>12}  counts")
+    for row in results:
+        counts = ", ".join(
+            f"{CLASS_NAMES.get(cid, cid)} {n}" for cid, n in row["counts"].items()
+        )
+        print(
+            f"{row['conf']:>6.3g}{row['iou']:>6.3g}{row['detection_rate']:>12.1f}"
+            f"{row['accuracy']:>12.1f}  {counts}"
+        )
+        if args.metrics:
+            for line in format_report(row["report"]):
+                print(f"    {line}")
+    print(f"{len(results)} settings re-thresholded in {elapsed:.2f}s")
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"model": str(args.model), "sha256": digest, "results": results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,26 @@ ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from spatial.data import CLASS_NAMES
-from spatial.inference import download_image, evaluate_batch, load_model, predict_image
+from spatial.data import CLASS_NAMES, ImageCache
+from spatial.detection import propose_regions
+from spatial.evaluation import DEFAULT_SWEEP, evaluate_table, format_report
+from spatial.fetch import read_url_list, url_stem
+from spatial.imaging import decode_bytes, read_image
+from spatial.inference import (
+    ANNOTATE_LIMIT,
+    download_bytes,
+    evaluate_batch,
+    iter_file_list,
+    iter_image_files,
+    iter_url_predictions,
+    load_model,
+    predict_image,
+    stream_predictions,
+)
+from spatial.results import DetectionTable
+from spatial.sharding import evaluate_sharded
+from spatial.tiling import count_tiles, predict_tiled, save_tiled_prediction
+from spatial.timing import StageTimer, format_timings, timed
 
 
 def parse_args() -> argparse.Namespace:
@@ -30,6 +48,54 @@ def parse_args() -> argparse.Namespace:
         type=str,
         help="Remote image URL to download and analyse.",
     )
+    parser.add_argument(
+        "--url-file",
+        type=Path,
+        help="Text file with one image URL per line, downloaded and analysed in bulk.",
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=8,
+        help="Concurrent downloads for --url-file.",
+    )
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="Large-field mode for --image/--url: overlapping tiles + global NMS.",
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=424,
+        help="Tile size in pixels for --tiled (training cutouts are 424px).",
+    )
+    parser.add_argument(
+        "--tile-overlap",
+        type=float,
+        default=0.2,
+        help="Overlap fraction between neighbouring tiles for --tiled.",
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help=(
+            "With --tiled: only classify crops around sources found by a "
+            "threshold detector instead of every tile."
+        ),
+    )
+    parser.add_argument(
+        "--source-threshold",
+        type=int,
+        default=100,
+        help="Grey level (0-255) above which a pixel belongs to a source (--prefilter).",
+    )
+    parser.add_argument(
+        "--min-source-area",
+        type=int,
+        default=2,
+        help="Minimum source area in pixels for --prefilter.",
+    )
     parser.add_argument(
         "--folder",
         type=Path,
@@ -42,6 +108,33 @@ def parse_args() -> argparse.Namespace:
         default=Path("data/processed/galaxy_expert/val/labels"),
         help="Ground truth labels folder for stats (optional).",
     )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help=(
+            "Image cache built by train.py --build-cache; batch stats then "
+            "read frames and labels from it instead of --folder/--labels."
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        type=Path,
+        help=(
+            "Bulk mode: walk --folder recursively (or --file-list) and write one "
+            "JSON line per image to this file, resuming an existing output."
+        ),
+    )
+    parser.add_argument(
+        "--file-list",
+        type=Path,
+        help="Text file with one image path per line, used by --stream.",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="With --stream, overwrite the output instead of skipping processed images.",
+    )
     parser.add_argument(
         "--count",
         type=int,
@@ -54,27 +147,147 @@ def parse_args() -> argparse.Namespace:
         default=Path("outputs/predictions"),
         help="Where to save annotated images.",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Images per forward pass when running batch predictions.",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=2,
+        help="Threads decoding images ahead of the model (0 to decode inline).",
+    )
+    parser.add_argument(
+        "--annotate",
+        choices=("auto", "sync", "async", "none"),
+        default="auto",
+        help=(
+            "Annotated images for batch runs: written inline, by a background "
+            f"writer, or skipped (stats only). 'auto' skips them above "
+            f"{ANNOTATE_LIMIT} images."
+        ),
+    )
+    parser.add_argument(
+        "--detections",
+        type=Path,
+        default=None,
+        help=(
+            "With --count: save every detection of the run as a columnar table "
+            "(.npz, or .parquet with pyarrow installed)."
+        ),
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help=(
+            "With --count: print the confusion matrix, per-class precision / "
+            "recall / F1, calibration and a sweep over higher conf thresholds."
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help=(
+            "Worker processes for batch stats, each loading the model once and "
+            "using its share of the CPU cores."
+        ),
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help=(
+            "Print per-stage timings (model load, image read, preprocess, "
+            "inference, postprocess, plot, write, label lookup)."
+        ),
+    )
     parser.add_argument("--conf", type=float, default=0.25)
     parser.add_argument("--iou", type=float, default=0.45)
     return parser.parse_args()
 
 
+def print_timings(timer) -> None:
+    if timer is None:
+        return
+    print("Stage timings:")
+    for line in format_timings(timer.summary()):
+        print(f"  {line}")
+
+
 def main() -> None:
     args = parse_args()
-    model = load_model(args.model)
+    # Sharded runs load the model in each worker process instead
+    sharded = (
+        args.processes > 1
+        and args.count > 0
+        and not (args.image or args.url or args.url_file or args.stream)
+    )
+    timer = StageTimer() if args.timings else None
+    model = None
+    if not sharded:
+        with timed(timer, "load"):
+            model = load_model(args.model)
 
     if args.image or args.url:
         if args.url:
-            local_path = download_image(args.url)
+            source, name = download_bytes(args.url), url_stem(args.url)
         else:
-            local_path = args.image
+            source, name = args.image, args.image.stem
+
+        if args.tiled:
+            frame = decode_bytes(source) if args.url else read_image(source)
+            proposals = None
+            if args.prefilter:
+                proposals = propose_regions(
+                    frame,
+                    threshold=args.source_threshold,
+                    min_area=args.min_source_area,
+                )
+            tiled = predict_tiled(
+                model,
+                frame,
+                tile_size=args.tile_size,
+                overlap=args.tile_overlap,
+                conf=args.conf,
+                iou=args.iou,
+                batch_size=args.batch_size,
+                regions=proposals["regions"] if proposals else None,
+            )
+            out_path = save_tiled_prediction(
+                frame, tiled["detections"], args.output_dir, name
+            )
+            width, height = tiled["image_size"]
+            print(f"Annotated image saved to: {out_path}")
+            if proposals:
+                grid = count_tiles((width, height), args.tile_size, args.tile_overlap)
+                print(
+                    f"{width}x{height} frame, {proposals['sources']} sources, "
+                    f"{tiled['tiles']} regions classified (vs {grid} tiles) "
+                    f"-> {len(tiled['detections'])} detections"
+                )
+            else:
+                print(
+                    f"{width}x{height} frame, {tiled['tiles']} tiles "
+                    f"-> {len(tiled['detections'])} detections"
+                )
+            for det in tiled["detections"]:
+                x1, y1, x2, y2 = det["box"]
+                print(
+                    f"- {det['class_name']} conf={det['confidence']:.2f} "
+                    f"box=({x1:.0f}, {y1:.0f}, {x2:.0f}, {y2:.0f})"
+                )
+            return
 
         out_path, detections = predict_image(
             model,
-            local_path,
+            source,
             args.output_dir,
             conf=args.conf,
             iou=args.iou,
+            name=name,
+            timer=timer,
         )
 
         print(f"Annotated image saved to: {out_path}")
@@ -87,38 +300,151 @@ def main() -> None:
                     f"- {det['class_name']} (id={det['class_id']}) "
                     f"conf={det['confidence']:.2f}"
                 )
+        print_timings(timer)
         return
 
-    if args.count > 0:
-        images = list(Path(args.folder).glob("*.jpg"))
-        if not images:
-            raise SystemExit(f"No images found in {args.folder}")
+    if args.url_file:
+        annotate = "none" if args.annotate == "auto" else args.annotate
+        processed = failed = 0
+        for record in iter_url_predictions(
+            model,
+            read_url_list(args.url_file),
+            args.output_dir,
+            conf=args.conf,
+            iou=args.iou,
+            batch_size=args.batch_size,
+            annotate=annotate,
+            download_workers=args.download_workers,
+        ):
+            processed += 1
+            if "error" in record:
+                failed += 1
+                print(f"{record['image']}: error ({record['error']})")
+            elif record["prediction"] is None:
+                print(f"{record['image']}: no detection")
+            else:
+                print(
+                    f"{record['image']}: {record['prediction_name']} "
+                    f"conf={record['confidence']:.2f}"
+                )
+        print(f"Processed {processed} URLs ({failed} failed).")
+        return
 
-        sampled = random.sample(images, k=min(len(images), args.count))
+    if args.stream:
+        images = iter_file_list(args.file_list) if args.file_list else iter_image_files(args.folder)
         label_dir = args.labels if args.labels.exists() else None
-        summary = evaluate_batch(
+        annotate = "none" if args.annotate == "auto" else args.annotate
+        summary = stream_predictions(
             model,
-            sampled,
+            images,
+            args.stream,
             save_dir=args.output_dir,
             label_dir=label_dir,
             conf=args.conf,
             iou=args.iou,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            annotate=annotate,
+            resume=not args.no_resume,
+            timer=timer,
+        )
+        print(
+            f"Processed {summary['total_images']} images "
+            f"({summary['skipped']} already done) -> {summary['output_path']}"
         )
+        if summary["errors"]:
+            print(f"{summary['errors']} unreadable images (see their error field)")
+        print(f"Throughput: {summary['images_per_sec']:.1f} images/sec")
+        if summary["verifiable"]:
+            print(f"Accuracy on this run (when GT available): {summary['accuracy']:.2f}%")
+        print_timings(timer)
+        return
+
+    if args.count > 0:
+        if args.cache and args.processes > 1:
+            raise SystemExit("--processes works on image files, not with --cache.")
+        if args.cache:
+            cache = ImageCache(args.cache)
+            picked = random.sample(range(len(cache)), k=min(len(cache), args.count))
+            sampled = cache.select(picked)
+            label_dir = None
+        else:
+            images = list(Path(args.folder).glob("*.jpg"))
+            if not images:
+                raise SystemExit(f"No images found in {args.folder}")
+
+            sampled = random.sample(images, k=min(len(images), args.count))
+            label_dir = args.labels if args.labels.exists() else None
+        annotate = args.annotate
+        if annotate == "auto":
+            annotate = "sync" if len(sampled) <= ANNOTATE_LIMIT else "none"
+        table = DetectionTable() if args.detections or args.metrics else None
+        if args.processes > 1:
+            summary = evaluate_sharded(
+                args.model,
+                sampled,
+                save_dir=args.output_dir,
+                label_dir=label_dir,
+                conf=args.conf,
+                iou=args.iou,
+                processes=args.processes,
+                batch_size=args.batch_size,
+                annotate=annotate,
+                timer=timer,
+                table=table,
+            )
+        else:
+            summary = evaluate_batch(
+                model,
+                sampled,
+                save_dir=args.output_dir,
+                label_dir=label_dir,
+                conf=args.conf,
+                iou=args.iou,
+                batch_size=args.batch_size,
+                decode_workers=args.decode_workers,
+                annotate=annotate,
+                timer=timer,
+                table=table,
+                keep_details=False,
+            )
 
         print(
             f"Processed {summary['total_images']} images "
             f"-> detection rate {summary['detection_rate']:.1f}%"
         )
-        if label_dir:
+        if summary["errors"]:
+            print(f"{summary['errors']} unreadable images left out of the statistics")
+        print(
+            f"Throughput: {summary['images_per_sec']:.1f} images/sec "
+            f"(batch size {summary['batch_size']})"
+        )
+        if summary["verifiable"]:
             print(f"Accuracy (when GT available): {summary['accuracy']:.2f}%")
         print("Counts per class:")
         for cid, count in summary["counts"].items():
             print(f"- {CLASS_NAMES.get(cid, cid)}: {count}")
-        print(f"Annotated outputs in: {summary['output_dir']}")
+        if annotate == "none":
+            print("Annotated outputs skipped (stats only).")
+        else:
+            print(f"Annotated outputs in: {summary['output_dir']}")
+        if args.metrics:
+            # Only thresholds at or above the run's conf can be recomputed
+            thresholds = [args.conf] + [t for t in DEFAULT_SWEEP if t > args.conf]
+            for line in format_report(evaluate_table(table, thresholds)):
+                print(line)
+        if args.detections:
+            saved = table.save(args.detections)
+            print(
+                f"{len(table.detections)} detections of {table.num_images} images "
+                f"saved to: {saved}"
+            )
+        print_timings(timer)
         return
 
     raise SystemExit(
-        "Provide an --image, --url or set --count with a folder to run batch stats."
+        "Provide an --image, --url, --url-file or set --count with a folder "
+        "to run batch stats."
     )
 
 
@@ -8,7 +8,9 @@ ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from spatial.data import prepare_dataset
+from spatial.data import CLASS_NAMES, build_image_cache, label_sweep, prepare_dataset
+from spatial.labels import parse_thresholds
+from spatial.onnx_backend import export_onnx
 
 
 def parse_args() -> argparse.Namespace:
@@ -43,6 +45,53 @@ def parse_args() -> argparse.Namespace:
         default=0.2,
         help="Validation split ratio.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Threads used to copy images and write labels.",
+    )
+    parser.add_argument(
+        "--image-cache",
+        type=Path,
+        default=None,
+        help=(
+            "Shared folder of extracted images; by default images are read "
+            "straight from the zip."
+        ),
+    )
+    parser.add_argument(
+        "--link",
+        choices=("copy", "hardlink", "symlink"),
+        default="hardlink",
+        help="How images from --image-cache are placed in the dataset.",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=str,
+        default=None,
+        help=(
+            "Labelling thresholds: JSON file or 'name=value,...' "
+            "(artefact, edge_on, features, spiral, smooth)."
+        ),
+    )
+    parser.add_argument(
+        "--sweep-thresholds",
+        type=Path,
+        default=None,
+        help=(
+            "JSON file with a list of threshold sets: print the class "
+            "histogram of each and exit."
+        ),
+    )
+    parser.add_argument(
+        "--build-cache",
+        action="store_true",
+        help=(
+            "Also decode the train/val images once at --img-size into "
+            "memory-mapped caches (<output-dir>/cache/<split>_<size>)."
+        ),
+    )
     parser.add_argument(
         "--base-weights",
         type=str,
@@ -71,6 +120,14 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Only build the dataset without running training.",
     )
+    parser.add_argument(
+        "--export-onnx",
+        action="store_true",
+        help=(
+            "Also export the best checkpoint to ONNX next to the copied .pt "
+            "(faster CPU inference with onnxruntime)."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -79,14 +136,46 @@ def main() -> None:
 
     dataset_size = None if args.dataset_size is None or args.dataset_size <= 0 else args.dataset_size
 
+    if args.sweep_thresholds:
+        threshold_sets = parse_thresholds(args.sweep_thresholds)
+        if isinstance(threshold_sets, dict):
+            threshold_sets = [threshold_sets]
+        histograms = label_sweep(
+            args.labels_csv, threshold_sets, dataset_size=dataset_size
+        )
+        for thresholds, counts in zip(threshold_sets, histograms):
+            total = sum(counts.values()) or 1
+            print(", ".join(f"{k}={v}" for k, v in thresholds.items()))
+            for cid, count in counts.items():
+                print(f"  - {CLASS_NAMES[cid]}: {count} ({count / total:.1%})")
+        return
+
+    thresholds = parse_thresholds(args.thresholds) if args.thresholds else None
+    if isinstance(thresholds, list):
+        raise SystemExit("--thresholds expects a single threshold set.")
+
     dataset_yaml, dataset_root = prepare_dataset(
         zip_path=args.zip_path,
         labels_csv=args.labels_csv,
         output_dir=args.output_dir,
         dataset_size=dataset_size,
         val_split=args.val_split,
+        workers=args.workers,
+        image_cache=args.image_cache,
+        link=args.link,
+        thresholds=thresholds,
     )
 
+    if args.build_cache:
+        for split in ("train", "val"):
+            build_image_cache(
+                dataset_root / split / "images",
+                dataset_root / "cache" / f"{split}_{args.img_size}",
+                labels_dir=dataset_root / split / "labels",
+                img_size=args.img_size,
+                workers=args.workers,
+            )
+
     if args.prepare_only:
         print("Dataset prepared. Skipping training as requested.")
         return
@@ -110,6 +199,9 @@ def main() -> None:
     if best_path.exists():
         shutil.copy2(best_path, dest)
         print(f"Training complete. Best model copied to {dest}")
+        if args.export_onnx:
+            onnx_path = export_onnx(dest, imgsz=args.img_size, dest=dest.with_suffix(".onnx"))
+            print(f"ONNX export written to {onnx_path}")
     else:
         print("Training finished but no best.pt was found to copy.")
 
@@ -0,0 +1,449 @@
+"""
+Interface web asynchrone (ASGI) pour Spatial - mode production
+
+Même API JSON que app_flask.py, mais :
+- les requêtes sont traitées de façon asynchrone (aucun thread bloqué pendant
+  un téléchargement ou une inférence) ;
+- les téléchargements d'URL sont attendus en parallèle sur un pool dédié,
+  borné lui aussi : au-delà de MAX_FETCH_PENDING téléchargements, 503 ;
+- l'inférence tourne sur un exécuteur borné appartenant à l'application :
+  au-delà de MAX_QUEUE_DEPTH requêtes en attente, réponse 503 immédiate ;
+- le démarrage ne bloque pas sur le chargement du modèle : GET /ready
+  répond 503 tant qu'il n'est pas prêt.
+La page d'accueil (templates/index.html) et les fichiers de static/ sont
+servis comme avec Flask. La configuration et la logique des routes sont
+partagées avec app_flask.py (spatial/serving.py).
+
+Lancement : uvicorn app_asgi:app --host 0.0.0.0 --port 5001
+"""
+import asyncio
+import io
+import json
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header
+
+from spatial.data import CLASS_NAMES
+from spatial.fetch import DownloadTooLarge, default_fetcher
+from spatial.serving import (
+    BATCH_MAX_IMAGES,
+    BATCH_MAX_SIZE,
+    MAX_CONTENT_LENGTH,
+    BoundedExecutor,
+    Overloaded,
+    RequestError,
+    ServingState,
+    batch_urls,
+    check_batch,
+    compact_results,
+    format_result,
+    model_candidate,
+    random_val_image,
+    serving_model_path,
+)
+
+# Configuration partagée avec app_flask.py (spatial/serving.py) ;
+# SPATIAL_MODEL_PATH pour servir un autre poids
+MODEL_PATH = serving_model_path()
+# Exécuteur d'inférence : assez de threads pour remplir un batch, et au plus
+# MAX_QUEUE_DEPTH requêtes admises (en cours + en attente) avant les 503
+INFERENCE_WORKERS = BATCH_MAX_SIZE
+MAX_QUEUE_DEPTH = int(os.environ.get("SPATIAL_MAX_QUEUE_DEPTH", 32))
+# Téléchargements simultanés d'URL (pool séparé : un serveur lent ne bloque
+# pas l'inférence), au plus MAX_FETCH_PENDING admis (en cours + en attente)
+# avant les 503 ; de quoi accueillir au moins un /predict_batch complet
+FETCH_WORKERS = 16
+MAX_FETCH_PENDING = max(
+    BATCH_MAX_IMAGES, int(os.environ.get("SPATIAL_MAX_FETCH_PENDING", 128))
+)
+RETRY_AFTER_SECONDS = 1
+# Page d'accueil et fichiers statiques (mêmes dossiers que Flask)
+ROOT_DIR = Path(__file__).resolve().parent
+TEMPLATES_DIR = ROOT_DIR / "templates"
+STATIC_DIR = ROOT_DIR / "static"
+
+# Modèles, micro-batching (attente et étapes par requête dans GET /metrics)
+# et cache des prédictions
+state = ServingState()
+models, batcher, cache = state.models, state.batcher, state.cache
+inference = BoundedExecutor(workers=INFERENCE_WORKERS, max_pending=MAX_QUEUE_DEPTH)
+downloads = BoundedExecutor(
+    workers=FETCH_WORKERS, max_pending=MAX_FETCH_PENDING, name="spatial-url"
+)
+
+# État du chargement initial du modèle (thread d'arrière-plan)
+_loading = {"status": "idle", "error": None}
+_loading_lock = threading.Lock()
+
+
+class Page:
+    """Réponse non JSON (page HTML, fichier statique)"""
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+
+
+def _load_initial_model():
+    try:
+        models.swap(MODEL_PATH)
+        status, error = "ready", None
+    except Exception as e:
+        status, error = "error", str(e)
+    with _loading_lock:
+        _loading.update(status=status, error=error)
+
+
+def start_loading():
+    """Lance le chargement du modèle en arrière-plan (une seule fois)"""
+    with _loading_lock:
+        if _loading["status"] != "idle":
+            return
+        _loading["status"] = "loading"
+    threading.Thread(target=_load_initial_model, name="spatial-model-load", daemon=True).start()
+
+
+def _require_ready():
+    with _loading_lock:
+        status, error = _loading["status"], _loading["error"]
+    if status == "error":
+        raise RequestError(503, f"Échec du chargement du modèle: {error}")
+    if status != "ready":
+        raise RequestError(503, "Modèle en cours de chargement")
+
+
+async def _run_inference(fn, *args):
+    """Exécute fn sur l'exécuteur borné (Overloaded -> 503 sans attendre)"""
+    return await asyncio.wrap_future(inference.submit(fn, *args))
+
+
+def _check_capacity():
+    """Refus avant de télécharger si l'inférence est déjà saturée"""
+    if inference.full:
+        raise Overloaded("file d'inférence pleine")
+
+
+async def _download(urls):
+    """
+    Télécharge les URL sur le pool borné, {url: octets ou exception}. Si le
+    pool ne peut pas tout admettre, rien n'est téléchargé (Overloaded -> 503)
+    """
+    fetcher = default_fetcher()
+    futures = []
+    try:
+        for url in urls:
+            futures.append(downloads.submit(fetcher.fetch, url))
+    except Overloaded:
+        for future in futures:
+            future.cancel()
+        raise
+    bodies = await asyncio.gather(
+        *(asyncio.wrap_future(future) for future in futures), return_exceptions=True
+    )
+    return dict(zip(urls, bodies))
+
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if len(body) > MAX_CONTENT_LENGTH:
+            raise RequestError(413, "Requête trop volumineuse")
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key.decode('latin-1').lower() == name:
+            return value.decode('latin-1')
+    return ''
+
+
+async def _multipart(scope, body):
+    """
+    (form, files) d'un corps multipart, None pour les autres types. Le corps
+    (jusqu'à 16MB) est analysé hors de la boucle d'événements
+    """
+    mimetype, options = parse_options_header(_header(scope, 'content-type'))
+    if mimetype != 'multipart/form-data':
+        return None
+    parser = FormDataParser(max_content_length=MAX_CONTENT_LENGTH)
+    _, form, files = await asyncio.get_running_loop().run_in_executor(
+        None, parser.parse, io.BytesIO(body), mimetype, len(body), options
+    )
+    return form, files
+
+
+async def _uploaded_image(scope, body):
+    """Image envoyée en multipart (champ 'image', comme Flask) ou en corps brut"""
+    parsed = await _multipart(scope, body)
+    if parsed is None:
+        if not body:
+            raise RequestError(400, 'Aucune image fournie')
+        return body
+    _, files = parsed
+    if 'image' not in files:
+        raise RequestError(400, 'Aucune image fournie')
+    file = files['image']
+    if file.filename == '':
+        raise RequestError(400, 'Aucun fichier sélectionné')
+    return file.read()
+
+
+def _json_body(body):
+    try:
+        return json.loads(body or b'{}')
+    except ValueError:
+        raise RequestError(400, 'JSON invalide')
+
+
+async def predict(scope, body):
+    """Prédiction sur une image uploadée"""
+    _require_ready()
+    img_bytes = await _uploaded_image(scope, body)
+    predictor, model_id = state.serving()
+    output_jpeg, detections = await _run_inference(
+        cache.predict, predictor, img_bytes, model_id
+    )
+    return 200, format_result(output_jpeg, detections)
+
+
+async def predict_url(scope, body):
+    """Prédiction sur une image téléchargée depuis une URL"""
+    _require_ready()
+    url = _json_body(body).get('url')
+    if not url:
+        raise RequestError(400, 'URL non fournie')
+
+    predictor, model_id = state.serving()
+    result = cache.lookup_url(url, model_id)
+    if result is None:
+        _check_capacity()
+        data = (await _download([url]))[url]
+        if isinstance(data, DownloadTooLarge):
+            raise RequestError(413, str(data))
+        if isinstance(data, Exception):
+            raise RequestError(502, f'Téléchargement impossible: {data}')
+        result = await _run_inference(
+            lambda: cache.predict_url(predictor, url, model_id, fetch=lambda _: data)
+        )
+
+    payload = format_result(*result)
+    payload['url'] = url
+    return 200, payload
+
+
+async def _fetch_missing(urls, model_id, conf, iou, annotate):
+    """
+    Télécharge en parallèle les URL absentes du cache. Renvoie {url: octets ou
+    exception}, transmis tel quel à PredictionCache.predict_many_urls.
+    """
+    missing = list(dict.fromkeys(
+        url for url in urls if cache.lookup_url(url, model_id, conf, iou, annotate) is None
+    ))
+    return await _download(missing)
+
+
+async def predict_batch(scope, body):
+    """
+    Prédiction sur plusieurs images en un appel : fichiers multipart (champ
+    'images', répété) ou JSON {"urls": [...]}. Réponse compacte, sans images
+    annotées sauf avec annotate=true.
+    """
+    _require_ready()
+    parsed = await _multipart(scope, body)
+    if parsed is None:
+        options = _json_body(body)
+        names = batch_urls(options)
+    else:
+        options, files = parsed
+        files = files.getlist('images') or files.getlist('image')
+        names = [f.filename for f in files]
+    annotate, conf, iou = check_batch(names, options)
+
+    predictor, model_id = state.serving()
+    if parsed is None:
+        _check_capacity()
+        fetched = await _fetch_missing(names, model_id, conf, iou, annotate)
+        values = await _run_inference(
+            cache.predict_many_urls,
+            predictor, names, model_id, conf, iou, annotate, None, fetched,
+        )
+    else:
+        values = await _run_inference(
+            cache.predict_many,
+            predictor, [f.read() for f in files], model_id, conf, iou, annotate,
+        )
+    return 200, compact_results(names, values, include_images=annotate)
+
+
+async def random_test(scope, body):
+    """Prédiction sur une image aléatoire du dataset de test"""
+    _require_ready()
+    random_image, true_class_name = random_val_image()
+
+    predictor, model_id = state.serving()
+    output_jpeg, detections = await _run_inference(
+        cache.predict, predictor, random_image, model_id
+    )
+    payload = format_result(output_jpeg, detections)
+    payload.update(filename=random_image.name, true_class=true_class_name)
+    return 200, payload
+
+
+async def model_info(scope, body):
+    """Modèle servi (GET) ou bascule à chaud vers un autre modèle de models/ (POST)"""
+    if scope['method'] == 'POST':
+        _require_ready()
+        candidate = model_candidate(_json_body(body).get('model'))
+        # Chargement + préchauffage hors de la boucle d'événements
+        await asyncio.get_running_loop().run_in_executor(None, models.swap, candidate)
+
+    return 200, state.model_info()
+
+
+async def ready(scope, body):
+    """Disponibilité : 200 une fois le modèle chargé, 503 avant (ou en cas d'échec)"""
+    with _loading_lock:
+        status, error = _loading["status"], _loading["error"]
+    payload = {'ready': status == 'ready', 'status': status}
+    if error:
+        payload['error'] = error
+    return (200 if status == 'ready' else 503), payload
+
+
+_templates = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)), autoescape=True)
+_templates.globals['url_for'] = lambda endpoint, filename: f"/{endpoint}/{filename}"
+
+
+async def index(scope, body):
+    """Page d'accueil (même gabarit que app_flask.py)"""
+    page = _templates.get_template('index.html').render(class_names=CLASS_NAMES)
+    return 200, Page(page.encode(), 'text/html; charset=utf-8')
+
+
+def static_file(path):
+    """Fichier de static/ (None hors du dossier ou s'il n'existe pas)"""
+    target = (STATIC_DIR / path).resolve()
+    if STATIC_DIR not in target.parents or not target.is_file():
+        return None
+    content_type = mimetypes.guess_type(target.name)[0] or 'application/octet-stream'
+    return Page(target.read_bytes(), content_type)
+
+
+async def metrics(scope, body):
+    """Micro-batching, cache des prédictions, files d'inférence et de téléchargement"""
+    return 200, {**state.stats(), 'executor': inference.stats(), 'downloads': downloads.stats()}
+
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('GET', '/index.html'): index,
+    ('POST', '/predict'): predict,
+    ('POST', '/predict_url'): predict_url,
+    ('POST', '/predict_batch'): predict_batch,
+    ('POST', '/random_test'): random_test,
+    ('GET', '/model'): model_info,
+    ('POST', '/model'): model_info,
+    ('GET', '/ready'): ready,
+    ('GET', '/metrics'): metrics,
+}
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_page(send, status, page):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', page.content_type.encode()),
+            (b'content-length', str(len(page.body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': page.body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Le serveur accepte des requêtes tout de suite, /ready dit quand
+            # le modèle est utilisable
+            start_loading()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            inference.shutdown(wait=False)
+            downloads.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Application ASGI"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    # Serveurs sans lifespan : le chargement démarre à la première requête
+    start_loading()
+    path = scope['path']
+    if scope['method'] == 'GET' and path.startswith('/static/'):
+        page = static_file(path[len('/static/'):])
+        if page is None:
+            await _send_json(send, 404, {'error': 'Fichier introuvable'})
+        else:
+            await _send_page(send, 200, page)
+        return
+
+    handler = ROUTES.get((scope['method'], path))
+    if handler is None:
+        await _send_json(send, 404, {'error': 'Route inconnue'})
+        return
+
+    try:
+        body = await _read_body(receive)
+        status, payload = await handler(scope, body)
+        if isinstance(payload, Page):
+            await _send_page(send, status, payload)
+        else:
+            await _send_json(send, status, payload)
+    except Overloaded:
+        await _send_json(
+            send,
+            503,
+            {'error': 'Serveur saturé, réessayez plus tard'},
+            headers=[(b'retry-after', str(RETRY_AFTER_SECONDS).encode())],
+        )
+    except RequestError as e:
+        await _send_json(send, e.status, {'error': e.message})
+    except Exception as e:
+        await _send_json(send, 500, {'error': str(e)})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print(f"Modèle: {MODEL_PATH}")
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -1,38 +1,39 @@
 """
 Interface Flask pour Spatial - Détection de galaxies
 """
-import io
-import base64
-import random
-from pathlib import Path
 from flask import Flask, render_template, request, jsonify, send_file
-from PIL import Image
-import numpy as np
 
 from spatial.data import CLASS_NAMES
-from spatial.inference import download_image, load_model, predict_image
+from spatial.serving import (
+    MAX_CONTENT_LENGTH,
+    RequestError,
+    ServingState,
+    batch_urls,
+    check_batch,
+    compact_results,
+    format_result,
+    model_candidate,
+    random_val_image,
+    serving_model_path,
+)
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Configuration
-MODEL_PATH = Path("models/galaxy_model_v2_expert.pt")
-VAL_IMAGES_DIR = Path("data/processed/galaxy_expert/val/images")
-OUTPUT_DIR = Path("outputs/flask")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# Configuration partagée avec app_asgi.py (spatial/serving.py) ;
+# SPATIAL_MODEL_PATH pour servir un autre poids
+MODEL_PATH = serving_model_path()
 
-# Charger le modèle au démarrage
+# Charger le modèle au démarrage (préchauffé, gardé en cache pour les bascules).
+# Micro-batching des requêtes simultanées (attente et étapes par requête dans
+# GET /metrics) et cache des prédictions
 print("Chargement du modèle...")
-model = load_model(MODEL_PATH)
+state = ServingState()
+models, batcher, cache = state.models, state.batcher, state.cache
+models.swap(MODEL_PATH)
 print("Modèle chargé avec succès!")
 
 
-def image_to_base64(image_path):
-    """Convertir une image en base64 pour l'affichage HTML"""
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
-
-
 @app.route('/')
 def index():
     """Page d'accueil"""
@@ -45,40 +46,20 @@ def predict():
     try:
         if 'image' not in request.files:
             return jsonify({'error': 'Aucune image fournie'}), 400
-        
+
         file = request.files['image']
         if file.filename == '':
             return jsonify({'error': 'Aucun fichier sélectionné'}), 400
-        
-        # Lire l'image
+
+        # Lire l'image (décodée en mémoire, aucun fichier temporaire)
         img_bytes = file.read()
-        img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-        
-        # Sauvegarder temporairement
-        temp_path = OUTPUT_DIR / "temp_input.jpg"
-        img.save(temp_path)
-        
+
         # Prédiction
-        output_path, detections = predict_image(model, temp_path, OUTPUT_DIR)
-        
-        # Convertir les détections au format attendu par le frontend
-        formatted_detections = []
-        for det in detections:
-            formatted_detections.append({
-                'class': det['class_name'],
-                'confidence': f"{det['confidence']:.2%}"
-            })
-        
-        # Convertir l'image de sortie en base64
-        output_b64 = image_to_base64(output_path)
-        
-        return jsonify({
-            'success': True,
-            'image': output_b64,
-            'detections': formatted_detections,
-            'count': len(formatted_detections)
-        })
-    
+        predictor, model_id = state.serving()
+        output_jpeg, detections = cache.predict(predictor, img_bytes, model_id)
+
+        return jsonify(format_result(output_jpeg, detections))
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -89,34 +70,53 @@ def predict_url():
     try:
         data = request.get_json()
         url = data.get('url')
-        
+
         if not url:
             return jsonify({'error': 'URL non fournie'}), 400
-        
-        # Télécharger l'image
-        temp_path = download_image(url)
-        
-        # Prédiction
-        output_path, detections = predict_image(model, temp_path, OUTPUT_DIR)
-        
-        # Convertir les détections au format attendu par le frontend
-        formatted_detections = []
-        for det in detections:
-            formatted_detections.append({
-                'class': det['class_name'],
-                'confidence': f"{det['confidence']:.2%}"
-            })
-        
-        # Convertir l'image de sortie en base64
-        output_b64 = image_to_base64(output_path)
-        
-        return jsonify({
-            'success': True,
-            'image': output_b64,
-            'detections': formatted_detections,
-            'count': len(formatted_detections)
-        })
-    
+
+        # Téléchargement en mémoire + prédiction (URL déjà vue : servie par le cache)
+        predictor, model_id = state.serving()
+        output_jpeg, detections = cache.predict_url(predictor, url, model_id)
+
+        return jsonify(format_result(output_jpeg, detections))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Prédiction sur plusieurs images en un appel : fichiers multipart (champ
+    'images', répété) ou JSON {"urls": [...]}. Réponse compacte, sans images
+    annotées sauf avec annotate=true.
+    """
+    try:
+        if request.is_json:
+            options = request.get_json() or {}
+            names = batch_urls(options)
+        else:
+            options = request.form
+            files = request.files.getlist('images') or request.files.getlist('image')
+            names = [f.filename for f in files]
+        annotate, conf, iou = check_batch(names, options)
+
+        # Un seul passage par le micro-batching pour toutes les images non
+        # présentes dans le cache (URL téléchargées en parallèle)
+        predictor, model_id = state.serving()
+        if request.is_json:
+            values = cache.predict_many_urls(
+                predictor, names, model_id, conf=conf, iou=iou, annotate=annotate
+            )
+        else:
+            values = cache.predict_many(
+                predictor, [f.read() for f in files], model_id,
+                conf=conf, iou=iou, annotate=annotate,
+            )
+        return jsonify(compact_results(names, values, include_images=annotate))
+
+    except RequestError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -125,54 +125,50 @@ def predict_url():
 def random_test():
     """Prédiction sur une image aléatoire du dataset de test"""
     try:
-        # Trouver toutes les images de validation
-        val_images = list(VAL_IMAGES_DIR.glob("*.jpg"))
-        if not val_images:
-            return jsonify({'error': 'Aucune image de validation trouvée'}), 404
-        
-        # Sélectionner une image aléatoire
-        random_image = random.choice(val_images)
-        
-        # Lire le vrai label si disponible
-        label_dir = Path("data/processed/galaxy_expert/val/labels")
-        label_path = label_dir / f"{random_image.stem}.txt"
-        true_class = None
-        true_class_name = None
-        
-        if label_path.exists():
-            with open(label_path, "r") as f:
-                line = f.readline().strip()
-                if line:
-                    true_class = int(line.split()[0])
-                    true_class_name = CLASS_NAMES.get(true_class, "Inconnu")
-        
+        # Image de validation aléatoire et son vrai label si disponible
+        random_image, true_class_name = random_val_image()
+
         # Prédiction
-        output_path, detections = predict_image(model, random_image, OUTPUT_DIR)
-        
-        # Convertir les détections au format attendu par le frontend
-        formatted_detections = []
-        for det in detections:
-            formatted_detections.append({
-                'class': det['class_name'],
-                'confidence': f"{det['confidence']:.2%}"
-            })
-        
-        # Convertir l'image de sortie en base64
-        output_b64 = image_to_base64(output_path)
-        
-        return jsonify({
-            'success': True,
-            'image': output_b64,
-            'detections': formatted_detections,
-            'count': len(formatted_detections),
-            'filename': random_image.name,
-            'true_class': true_class_name
-        })
-    
+        predictor, model_id = state.serving()
+        output_jpeg, detections = cache.predict(predictor, random_image, model_id)
+
+        payload = format_result(output_jpeg, detections)
+        payload.update(filename=random_image.name, true_class=true_class_name)
+        return jsonify(payload)
+
+    except RequestError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/model', methods=['GET', 'POST'])
+def model_info():
+    """Modèle servi (GET) ou bascule à chaud vers un autre modèle de models/ (POST)"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            # Seuls les poids du dossier models/ (.pt ou export .onnx) peuvent être chargés
+            candidate = model_candidate(data.get('model'))
+
+            # Chargement + préchauffage avant la bascule : les requêtes en
+            # cours terminent avec l'ancien modèle
+            models.swap(candidate)
+
+        return jsonify(state.model_info())
+
+    except RequestError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Micro-batching (file, tailles de batch, temps par étape) et cache des prédictions (hits/miss)"""
+    return jsonify(state.stats())
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("Spatial Galaxy Detector - Interface Web")
@@ -181,6 +177,6 @@ if __name__ == '__main__':
     print(f"Classes détectables: {', '.join(CLASS_NAMES.values())}")
     print("\nOuvrez votre navigateur à: http://localhost:5001")
     print("="*60 + "\n")
-    
+
     app.run(debug=True, host='0.0.0.0', port=5001)
 
@@ -0,0 +1,249 @@
+"""
+Inference benchmarks: throughput, latency percentiles, peak memory and a
+per-stage time breakdown, for regression tracking between commits.
+
+Everything can run offline: `synthetic_images` and `synthetic_model` build a
+fixed image set and an untrained detector without downloads.
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .data import CLASS_NAMES
+from .inference import iter_batch_predictions, predict_image
+from .timing import STAGE_ORDER, StageTimer
+
+
+def synthetic_images(dest: Path, count: int = 32, size: int = 424, seed: int = 0) -> List[Path]:
+    """
+    Writes `count` galaxy-like JPEGs (noisy background, bright ellipses) to
+    `dest`. The same seed always produces the same image set.
+    """
+    dest.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        image = rng.integers(0, 30, (size, size, 3), dtype=np.uint8)
+        for _ in range(int(rng.integers(1, 4))):
+            center = tuple(int(v) for v in rng.integers(size // 4, 3 * size // 4, 2))
+            axes = tuple(int(v) for v in rng.integers(size // 16, size // 5, 2))
+            color = tuple(int(v) for v in rng.integers(120, 255, 3))
+            cv2.ellipse(image, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+        image = cv2.GaussianBlur(image, (9, 9), 0)
+        path = dest / f"synthetic_{i:04d}.jpg"
+        cv2.imwrite(str(path), image)
+        paths.append(path)
+    return paths
+
+
+def synthetic_model(dest: Path, imgsz: int = 416, cfg: str = "yolov8n.yaml") -> Path:
+    """
+    Saves an untrained detector with the project's classes, built from an
+    Ultralytics architecture file (no weights download). Its predictions are
+    meaningless but its cost is that of a real model of the same size.
+    """
+    import torch
+    from ultralytics.nn.tasks import DetectionModel
+
+    model = DetectionModel(cfg, nc=len(CLASS_NAMES), verbose=False)
+    model.names = dict(CLASS_NAMES)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    torch.save({"model": model, "train_args": {"imgsz": imgsz}}, str(dest))
+    return dest
+
+
+def latency_summary(latencies_ms: Sequence[float]) -> Dict:
+    """
+    Mean and p50 / p95 / p99 of a list of latencies in milliseconds.
+    """
+    if not latencies_ms:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process so far, in MB (None where the
+    `resource` module is unavailable). It is a process-wide high-water mark:
+    to attribute it to one scenario, run that scenario in its own process
+    (as app/benchmark.py does).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _report(
+    count: int,
+    elapsed: float,
+    latencies_ms: Sequence[float],
+    timer: Optional[StageTimer] = None,
+    **extra,
+) -> Dict:
+    report = {
+        "images": count,
+        "elapsed_seconds": elapsed,
+        "images_per_sec": count / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": latency_summary(latencies_ms),
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+    if timer is not None:
+        # Mean milliseconds per image: read (decode), preprocess, inference
+        # (forward), postprocess (NMS), plot, write
+        report["stages_ms"] = {
+            stage: values["mean_ms"] for stage, values in timer.summary().items()
+        }
+    return report
+
+
+def bench_single(
+    model,
+    images: Sequence[Path],
+    save_dir: Path,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    repeat: int = 1,
+) -> Dict:
+    """
+    `predict_image` one image at a time, with an annotated copy written
+    each time, timed stage by stage.
+    """
+    timer = StageTimer()
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in images:
+            t0 = time.perf_counter()
+            predict_image(model, path, save_dir, conf=conf, iou=iou, timer=timer)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+    elapsed = time.perf_counter() - start
+
+    return _report(len(latencies), elapsed, latencies, timer)
+
+
+def bench_batched(
+    model,
+    images: Sequence[Path],
+    save_dir: Path,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    batch_size: int = 8,
+    decode_workers: int = 2,
+    annotate: str = "none",
+    repeat: int = 1,
+) -> Dict:
+    """
+    The `evaluate_batch` pipeline (threaded decode, mini-batches). Latency
+    is measured per image, from the pipeline taking the image (before its
+    decode) to its record coming out, so it includes the time spent queued
+    behind the images ahead of it. `batch_latency_ms` is the time between
+    two consecutive batches of results.
+    """
+    timer = StageTimer()
+    latencies: List[float] = []
+    batch_latencies: List[float] = []
+    count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        taken: List[float] = []
+
+        def _feed():
+            for path in images:
+                taken.append(time.perf_counter())
+                yield path
+
+        last = time.perf_counter()
+        # Records come out in input order: the i-th matches the i-th image taken
+        for i, _item in enumerate(
+            iter_batch_predictions(
+                model,
+                _feed(),
+                save_dir,
+                conf=conf,
+                iou=iou,
+                batch_size=batch_size,
+                decode_workers=decode_workers,
+                annotate=annotate,
+                timer=timer,
+            ),
+            start=1,
+        ):
+            now = time.perf_counter()
+            count += 1
+            latencies.append((now - taken[i - 1]) * 1000.0)
+            if i % batch_size == 0 or i == len(images):
+                batch_latencies.append((now - last) * 1000.0)
+                last = now
+    elapsed = time.perf_counter() - start
+
+    return _report(
+        count,
+        elapsed,
+        latencies,
+        timer,
+        batch_latency_ms=latency_summary(batch_latencies),
+        batch_size=batch_size,
+        annotate=annotate,
+    )
+
+
+def stage_means(before: Dict[str, Dict], after: Dict[str, Dict]) -> Dict[str, float]:
+    """
+    Mean milliseconds per stage between two `StageTimer.summary()` snapshots,
+    e.g. the server timings of `GET /metrics` before and after a run.
+    """
+    means = {}
+    # JSON round trips may reorder the stages: list them in display order
+    order = [s for s in STAGE_ORDER if s in after]
+    order += sorted(s for s in after if s not in STAGE_ORDER)
+    for stage in order:
+        values = after[stage]
+        previous = before.get(stage, {})
+        count = values["count"] - previous.get("count", 0)
+        if count > 0:
+            means[stage] = (values["total_ms"] - previous.get("total_ms", 0.0)) / count
+    return means
+
+
+def bench_requests(
+    send: Callable[[bytes], None],
+    payloads: Sequence[bytes],
+    concurrency: int = 1,
+    server_timings: Optional[Callable[[], Dict[str, Dict]]] = None,
+) -> Dict:
+    """
+    Calls `send(payload)` for each payload from `concurrency` client threads
+    and measures per-request latency (client side, from the call to the
+    response), e.g. against a Flask test client. `server_timings` returns the
+    server's `StageTimer.summary()`; read before and after the run, it gives
+    the per-request stage breakdown (`stages_ms`).
+    """
+    before = server_timings() if server_timings else None
+
+    def _timed(payload: bytes) -> float:
+        t0 = time.perf_counter()
+        send(payload)
+        return (time.perf_counter() - t0) * 1000.0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        latencies = list(pool.map(_timed, payloads))
+    elapsed = time.perf_counter() - start
+
+    report = _report(len(latencies), elapsed, latencies, concurrency=concurrency)
+    if server_timings:
+        report["stages_ms"] = stage_means(before, server_timings())
+    return report
@@ -0,0 +1,49 @@
+"""
+Vectorised bounding-box helpers (IoU, non-maximum suppression).
+"""
+
+import numpy as np
+
+
+def box_iou(box, boxes: np.ndarray) -> np.ndarray:
+    """
+    IoU between one xyxy box and an (N, 4) array of xyxy boxes.
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou: float = 0.45) -> np.ndarray:
+    """
+    Greedy non-maximum suppression. Returns the indices of the kept boxes,
+    highest score first.
+    """
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        order = rest[box_iou(boxes[best], boxes[rest]) <= iou]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(
+    boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou: float = 0.45
+) -> np.ndarray:
+    """
+    Class-aware NMS: boxes of different classes never suppress each other.
+    Implemented by offsetting each class into its own coordinate range.
+    """
+    if boxes.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    offset = classes.astype(boxes.dtype)[:, None] * (boxes.max() + 1.0)
+    return nms(boxes + offset, scores, iou)
@@ -1,7 +1,12 @@
+import json
+import os
 import shutil
+import threading
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 # Class mapping reused across training and inference
 CLASS_NAMES: Dict[int, str] = {
@@ -12,38 +17,178 @@ CLASS_NAMES: Dict[int, str] = {
 }
 
 
-def _assign_class(row) -> int:
+LINK_MODES = ("copy", "hardlink", "symlink")
+
+
+class _ZipImages:
+    """
+    Random access to the JPEG members of the Galaxy Zoo archive by GalaxyID,
+    without extracting the whole zip. Each worker thread gets its own handle
+    so members can be read concurrently.
+    """
+
+    def __init__(self, zip_path: Path):
+        self.zip_path = zip_path
+        self._local = threading.local()
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            self._members = {
+                Path(info.filename).stem: info
+                for info in zf.infolist()
+                if info.filename.lower().endswith(".jpg")
+            }
+
+    def _handle(self) -> zipfile.ZipFile:
+        handle = getattr(self._local, "handle", None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.zip_path, "r")
+            self._local.handle = handle
+        return handle
+
+    def has(self, img_id: str) -> bool:
+        return img_id in self._members
+
+    def size(self, img_id: str) -> int:
+        return self._members[img_id].file_size
+
+    def write(self, img_id: str, dest: Path) -> None:
+        tmp = dest.with_suffix(".part")
+        with self._handle().open(self._members[img_id]) as src, open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, dest)
+
+
+class _CachedImages:
     """
-    Reproduces the heuristic from the original notebook to build a single label
-    from Galaxy Zoo probabilities.
+    Images extracted once into a shared cache directory (only the members a
+    run needs), then copied, hard-linked or symlinked into the YOLO layout.
     """
-    if row["Class1.3"] > 0.4:
-        return 3
-    if row["Class2.1"] > 0.5:
-        return 2
-    if row["Class1.2"] > 0.5 and (row["Class4.1"] > 0.4 or row["Class3.1"] > 0.4):
-        return 1
-    if row["Class1.1"] > 0.5:
-        return 0
 
-    main_probs = {"0": row["Class1.1"], "1": row["Class1.2"], "3": row["Class1.3"]}
-    return int(max(main_probs, key=main_probs.get))
+    def __init__(self, archive: _ZipImages, cache_dir: Path, link: str = "hardlink"):
+        if link not in LINK_MODES:
+            raise ValueError(f"link must be one of {LINK_MODES}, got {link!r}")
+        self.archive = archive
+        self.cache_dir = cache_dir
+        self.link = link
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _cached(self, img_id: str) -> Path:
+        path = self.cache_dir / f"{img_id}.jpg"
+        if not path.exists() or path.stat().st_size != self.archive.size(img_id):
+            self.archive.write(img_id, path)
+        return path
+
+    def has(self, img_id: str) -> bool:
+        return self.archive.has(img_id)
+
+    def size(self, img_id: str) -> int:
+        return self.archive.size(img_id)
+
+    def write(self, img_id: str, dest: Path) -> None:
+        src = self._cached(img_id)
+        # Never write through an existing entry: it may be a hard link or a
+        # symlink to the shared cache left by a run with another link mode
+        if dest.exists() or dest.is_symlink():
+            dest.unlink()
+        if self.link == "copy":
+            shutil.copy2(src, dest)
+            return
+        if self.link == "symlink":
+            dest.symlink_to(src.resolve())
+            return
+        try:
+            os.link(src, dest)
+        except OSError:
+            # Cache on another filesystem: fall back to a plain copy
+            shutil.copy2(src, dest)
+
+
+def _materialize(
+    source, img_id: str, img_dest: Path, label_dest: Path, label_line: str
+) -> bool:
+    """
+    Writes one image from `source` and its label file unless both are already
+    up to date. Returns True when something was written.
+    """
+    if (
+        img_dest.exists()
+        and label_dest.exists()
+        and img_dest.stat().st_size == source.size(img_id)
+        and label_dest.read_text() == label_line
+    ):
+        return False
+
+    source.write(img_id, img_dest)
+    # Write then rename so an interrupted run never leaves a truncated label
+    tmp_label = label_dest.with_suffix(".tmp")
+    tmp_label.write_text(label_line)
+    os.replace(tmp_label, label_dest)
+    return True
+
+
+def _remove_stale(directory: Path, keep: Iterable[str]) -> None:
+    """
+    Deletes files left in `directory` by a previous run whose stem is no longer
+    part of the selection.
+    """
+    keep = set(keep)
+    for path in directory.iterdir():
+        if path.is_file() and path.stem not in keep:
+            path.unlink()
 
 
-def _extract_images(zip_path: Path, extract_to: Path) -> Path:
+def _process_split(pool, source, split_dir: Path, split_df) -> Tuple[int, int]:
     """
-    Unpacks the raw image archive if needed and returns the directory containing
-    the JPEG files.
+    Materialises one split (images/ + labels/) on the worker pool.
+    Returns the number of images in the split and how many had to be written.
     """
-    extract_to.mkdir(parents=True, exist_ok=True)
-    images_dir = extract_to / "images_training_rev1"
-    if images_dir.exists():
-        return images_dir
+    images_dir = split_dir / "images"
+    labels_dir = split_dir / "labels"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    labels_dir.mkdir(parents=True, exist_ok=True)
 
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        zf.extractall(extract_to)
+    img_ids = [str(gid) for gid in split_df["GalaxyID"].astype(int)]
+    labels = split_df["label"].tolist()
+    tasks = []
+    kept = []
+    for img_id, label in zip(img_ids, labels):
+        if not source.has(img_id):
+            continue
+        kept.append(img_id)
+        # Single box covering the full frame as in the notebook
+        label_line = f"{label} 0.5 0.5 0.6 0.6\n"
+        tasks.append(
+            (source, img_id, images_dir / f"{img_id}.jpg", labels_dir / f"{img_id}.txt", label_line)
+        )
 
-    return images_dir
+    _remove_stale(images_dir, kept)
+    _remove_stale(labels_dir, kept)
+    written = sum(pool.map(lambda task: _materialize(*task), tasks))
+    return len(tasks), written
+
+
+def _load_table(labels_csv: Path, dataset_size: Optional[int], seed: int):
+    import pandas as pd
+
+    df = pd.read_csv(labels_csv)
+    if dataset_size is not None:
+        df = df.sample(n=min(len(df), dataset_size), random_state=seed)
+    return df
+
+
+def label_sweep(
+    labels_csv: Path,
+    threshold_sets: List[Dict[str, float]],
+    dataset_size: Optional[int] = 12000,
+    seed: int = 42,
+) -> List[Dict[int, int]]:
+    """
+    Class histograms of the samples `prepare_dataset` would select, for each
+    threshold set, computed in one pass without touching any image.
+    """
+    from .labels import label_histograms, probability_matrix
+
+    df = _load_table(labels_csv, dataset_size, seed)
+    return label_histograms(probability_matrix(df), threshold_sets, len(CLASS_NAMES))
 
 
 def prepare_dataset(
@@ -53,10 +198,23 @@ def prepare_dataset(
     dataset_size: Optional[int] = 12000,
     val_split: float = 0.2,
     seed: int = 42,
+    workers: int = 8,
+    image_cache: Optional[Path] = None,
+    link: str = "hardlink",
+    thresholds: Optional[Dict[str, float]] = None,
 ) -> Tuple[Path, Path]:
     """
     Builds a YOLO-ready dataset from the Galaxy Zoo archive.
 
+    Only the selected members are read from the zip and written once into the
+    YOLO layout. With `image_cache`, they are instead extracted once into that
+    shared directory and linked into the layout (`link`: copy, hardlink or
+    symlink), so several output datasets can share the same files.
+
+    The step is incremental: images already present with matching labels are
+    kept as is, stale files from a previous selection are removed, and the
+    rest is materialised by a pool of `workers` threads.
+
     Args:
         zip_path: Path to images_training_rev1.zip.
         labels_csv: Path to training_solutions_rev1.csv.
@@ -64,46 +222,36 @@ def prepare_dataset(
         dataset_size: Number of samples to keep (None for full dataset).
         val_split: Fraction used for validation.
         seed: Random seed for reproducibility.
+        workers: Number of threads copying images and writing labels.
+        image_cache: Optional shared directory of extracted images.
+        link: How images are placed from `image_cache` into the dataset.
+        thresholds: Overrides for `spatial.labels.DEFAULT_THRESHOLDS`.
 
     Returns:
         dataset_yaml: Path to the generated dataset.yaml.
         output_dir: The directory containing train/ and val/ folders.
     """
-    import pandas as pd
     from sklearn.model_selection import train_test_split
 
-    images_root = _extract_images(zip_path, output_dir.parent / "galaxy_data")
-    df = pd.read_csv(labels_csv)
+    from .labels import assign_labels, probability_matrix
 
-    if dataset_size is not None:
-        df = df.sample(n=min(len(df), dataset_size), random_state=seed)
+    source = _ZipImages(zip_path)
+    if image_cache is not None:
+        source = _CachedImages(source, image_cache, link=link)
 
+    df = _load_table(labels_csv, dataset_size, seed)
+    df = df.assign(label=assign_labels(probability_matrix(df), thresholds))
     train_df, val_df = train_test_split(df, test_size=val_split, random_state=seed)
 
-    if output_dir.exists():
-        shutil.rmtree(output_dir)
-
-    for sub in ("train/images", "train/labels", "val/images", "val/labels"):
-        (output_dir / sub).mkdir(parents=True, exist_ok=True)
-
-    def _process_split(split_df: pd.DataFrame, split_name: str) -> int:
-        processed = 0
-        for _, row in split_df.iterrows():
-            img_id = str(int(row["GalaxyID"]))
-            img_name = f"{img_id}.jpg"
-            src_path = images_root / img_name
-            if not src_path.exists():
-                continue
-
-            shutil.copy2(src_path, output_dir / split_name / "images" / img_name)
-            with open(output_dir / split_name / "labels" / f"{img_id}.txt", "w") as f:
-                # Single box covering the full frame as in the notebook
-                f.write(f"{_assign_class(row)} 0.5 0.5 0.6 0.6\n")
-            processed += 1
-        return processed
-
-    train_count = _process_split(train_df, "train")
-    val_count = _process_split(val_df, "val")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        train_count, train_written = _process_split(
+            pool, source, output_dir / "train", train_df
+        )
+        val_count, val_written = _process_split(
+            pool, source, output_dir / "val", val_df
+        )
+    elapsed = time.perf_counter() - start
 
     dataset_yaml = output_dir / "dataset.yaml"
     with open(dataset_yaml, "w") as f:
@@ -114,9 +262,159 @@ def prepare_dataset(
         for idx, name in CLASS_NAMES.items():
             f.write(f"  {idx}: {name}\n")
 
+    processed = train_count + val_count
+    written = train_written + val_written
+    rate = processed / elapsed if elapsed > 0 else 0.0
     print(
         f"Dataset ready in {output_dir} "
-        f"({train_count} train / {val_count} val images, val split={val_split})"
+        f"({train_count} train / {val_count} val images, val split={val_split}; "
+        f"{written} written, {processed - written} already up to date; "
+        f"{rate:.1f} images/sec)"
     )
 
     return dataset_yaml, output_dir
+
+
+def read_label(label_dir: Optional[Path], stem: str) -> Optional[int]:
+    """
+    Class id on the first line of the YOLO label `<label_dir>/<stem>.txt`;
+    None without label directory, file or content. Every label lookup of
+    the package (evaluation, inference, image cache, web apps) goes through
+    it.
+    """
+    if not label_dir:
+        return None
+    try:
+        with open(Path(label_dir) / f"{stem}.txt", "rb") as f:
+            fields = f.readline().split()
+    except FileNotFoundError:
+        return None
+    return int(fields[0]) if fields else None
+
+
+def build_image_cache(
+    images_dir: Path,
+    cache_dir: Path,
+    labels_dir: Optional[Path] = None,
+    img_size: int = 416,
+    workers: int = 8,
+) -> Path:
+    """
+    Decodes every JPEG of `images_dir` once, letterboxed to `img_size`, into a
+    single memory-mapped array so repeated evaluations are I/O and decode free.
+
+    Writes to `cache_dir`:
+        images.npy: uint8 array (N, img_size, img_size, 3), BGR.
+        shapes.npy: int32 array (N, 2), (height, width) of the originals.
+        labels.npy: int16 array (N,), class id from `labels_dir` or -1.
+        index.json: image stems in array order plus the cache parameters.
+
+    Returns `cache_dir`. `index.json` is written last, so an interrupted build
+    is never mistaken for a complete cache.
+    """
+    import numpy as np
+
+    from .imaging import decode_image
+
+    paths = sorted(Path(images_dir).glob("*.jpg"))
+    if not paths:
+        raise ValueError(f"No images found in {images_dir}")
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index_path = cache_dir / "index.json"
+    if index_path.exists():
+        index_path.unlink()
+
+    tmp_images = cache_dir / "images.part.npy"
+    images = np.lib.format.open_memmap(
+        tmp_images, mode="w+", dtype=np.uint8, shape=(len(paths), img_size, img_size, 3)
+    )
+
+    shapes = np.zeros((len(paths), 2), dtype=np.int32)
+
+    def _fill(i: int) -> None:
+        images[i], shapes[i] = decode_image(paths[i], img_size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(_fill, range(len(paths))))
+    images.flush()
+    del images
+    os.replace(tmp_images, cache_dir / "images.npy")
+    np.save(cache_dir / "shapes.npy", shapes)
+
+    labels = np.array(
+        [-1 if cid is None else cid for cid in (read_label(labels_dir, p.stem) for p in paths)],
+        dtype=np.int16,
+    )
+    np.save(cache_dir / "labels.npy", labels)
+
+    with open(index_path, "w") as f:
+        json.dump(
+            {
+                "img_size": img_size,
+                "source_dir": str(images_dir),
+                "stems": [p.stem for p in paths],
+            },
+            f,
+        )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Image cache ready in {cache_dir} ({len(paths)} images at {img_size}px, "
+        f"{len(paths) / elapsed if elapsed > 0 else 0.0:.1f} images/sec)"
+    )
+    return cache_dir
+
+
+class ImageCache:
+    """
+    Read-only view over a cache built by `build_image_cache`. Images are
+    memory-mapped: frames are yielded as zero-copy slices of the array.
+    """
+
+    def __init__(self, cache_dir: Path, indices: Optional[Sequence[int]] = None):
+        import numpy as np
+
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / "index.json", "r") as f:
+            index = json.load(f)
+        self.img_size: int = index["img_size"]
+        self.source_dir = Path(index["source_dir"])
+        self.stems: List[str] = index["stems"]
+        self.images = np.load(self.cache_dir / "images.npy", mmap_mode="r")
+        self.labels = np.load(self.cache_dir / "labels.npy")
+        # Caches built before shapes were recorded only know letterboxed frames
+        shapes_path = self.cache_dir / "shapes.npy"
+        self.shapes = np.load(shapes_path) if shapes_path.exists() else None
+        self.indices = np.arange(len(self.stems)) if indices is None else np.asarray(indices)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def select(self, indices: Sequence[int]) -> "ImageCache":
+        """
+        Returns a cache restricted to `indices`, sharing the same mapping.
+        """
+        subset = object.__new__(ImageCache)
+        subset.__dict__.update(self.__dict__)
+        subset.indices = self.indices[list(indices)]
+        return subset
+
+    def iter_frames(self) -> Iterator[Tuple[Path, object, Optional[Tuple[int, int]]]]:
+        """
+        Yields (original image path, letterboxed BGR frame, original
+        (height, width) or None when the cache did not record it) in cache
+        order.
+        """
+        for i in self.indices:
+            shape = tuple(self.shapes[i].tolist()) if self.shapes is not None else None
+            yield self.source_dir / f"{self.stems[i]}.jpg", self.images[i], shape
+
+    def label_map(self) -> Dict[str, int]:
+        """
+        Ground-truth class per stem for the selected entries (known labels only).
+        """
+        return {
+            self.stems[i]: int(self.labels[i]) for i in self.indices if self.labels[i] >= 0
+        }
@@ -0,0 +1,82 @@
+"""
+Classical source detection for large sky frames.
+
+Productised version of the threshold + contour star detector from
+`TestNotebook/SPATIAL_V2.ipynb`: it proposes regions of interest so that
+only those crops go through the YOLO model instead of every tile.
+"""
+
+from typing import Dict
+
+import cv2
+import numpy as np
+
+
+def find_sources(
+    image: np.ndarray,
+    threshold: int = 100,
+    min_area: int = 2,
+    blur: int = 0,
+) -> np.ndarray:
+    """
+    Thresholds the frame and returns one (x, y, w, h, area) row per connected
+    bright blob, largest first.
+
+    Connected-component statistics are computed by OpenCV in a single pass
+    and filtered with NumPy, instead of looping over `findContours` output.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if blur:
+        gray = cv2.GaussianBlur(gray, (blur | 1, blur | 1), 0)
+    _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:]  # label 0 is the background
+    stats = stats[stats[:, cv2.CC_STAT_AREA] >= min_area]
+    return stats[np.argsort(-stats[:, cv2.CC_STAT_AREA], kind="stable")]
+
+
+def propose_regions(
+    image: np.ndarray,
+    threshold: int = 100,
+    min_area: int = 2,
+    context: float = 1.0 / 0.6,
+    min_size: int = 64,
+    blur: int = 0,
+) -> Dict:
+    """
+    Turns detected sources into square crops (x0, y0, w, h) framed like the
+    training cutouts: the object spans about 60% of the crop (`context`),
+    with at least `min_size` pixels.
+
+    Sources whose centre already falls inside an accepted crop are absorbed
+    by it, so clusters cost a single model call. Returns the crops and the
+    number of sources found.
+    """
+    sources = find_sources(image, threshold=threshold, min_area=min_area, blur=blur)
+    h, w = image.shape[:2]
+    if len(sources) == 0:
+        return {"regions": np.zeros((0, 4), dtype=np.int64), "sources": 0}
+
+    xs, ys, ws, hs = (sources[:, i].astype(np.float64) for i in range(4))
+    centers_x = xs + ws / 2.0
+    centers_y = ys + hs / 2.0
+    sizes = np.clip(np.maximum(ws, hs) * context, min_size, min(h, w)).astype(np.int64)
+    x0s = np.clip(np.round(centers_x - sizes / 2.0).astype(np.int64), 0, w - sizes)
+    y0s = np.clip(np.round(centers_y - sizes / 2.0).astype(np.int64), 0, h - sizes)
+
+    covered = np.zeros(len(sources), dtype=bool)
+    regions = []
+    for i in range(len(sources)):
+        if covered[i]:
+            continue
+        x0, y0, size = x0s[i], y0s[i], sizes[i]
+        regions.append((x0, y0, size, size))
+        covered |= (
+            (centers_x >= x0)
+            & (centers_x < x0 + size)
+            & (centers_y >= y0)
+            & (centers_y < y0 + size)
+        )
+
+    return {"regions": np.array(regions, dtype=np.int64), "sources": int(len(sources))}
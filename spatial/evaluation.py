@@ -0,0 +1,251 @@
+"""
+Vectorised evaluation of detection results against image labels.
+
+Ground truth is read once into an array (`load_labels`); the metrics work on
+the top-1 detection of each image of a `DetectionTable`: confusion matrix,
+per-class precision / recall / F1, calibration of the confidences, and
+sweeps over the confidence threshold. A table predicted at a low `conf` can
+be evaluated at every higher threshold without running the model again.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .data import CLASS_NAMES, read_label
+from .results import NO_CLASS, DetectionTable
+
+# Confidence thresholds of the default sweep
+DEFAULT_SWEEP = tuple(round(0.05 * i, 2) for i in range(1, 20))
+
+
+def load_labels(label_dir: Optional[Path], stems: Sequence[str]) -> np.ndarray:
+    """
+    `read_label` for every stem, in one pass: a single directory listing
+    skips the missing labels without trying to open them. `NO_CLASS` where
+    the label is missing or empty.
+    """
+    labels = np.full(len(stems), NO_CLASS, dtype=np.int16)
+    if not label_dir:
+        return labels
+    try:
+        available = set(os.listdir(label_dir))
+    except FileNotFoundError:
+        return labels
+    for i, stem in enumerate(stems):
+        if f"{stem}.txt" not in available:
+            continue
+        cid = read_label(label_dir, stem)
+        if cid is not None:
+            labels[i] = cid
+    return labels
+
+
+def label_map(label_dir: Optional[Path], stems: Sequence[str]) -> Dict[str, int]:
+    """
+    `load_labels` as a stem -> class id dict (known labels only).
+    """
+    labels = load_labels(label_dir, stems)
+    return {stem: int(cid) for stem, cid in zip(stems, labels.tolist()) if cid != NO_CLASS}
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    return np.divide(numerator, denominator, out=out, where=denominator > 0)
+
+
+def _valid(truth: np.ndarray, predicted: np.ndarray, num_classes: int) -> np.ndarray:
+    return (truth >= 0) & (truth < num_classes) & (predicted < num_classes)
+
+
+def confusion_matrix(
+    truth: np.ndarray, predicted: np.ndarray, num_classes: int = len(CLASS_NAMES)
+) -> np.ndarray:
+    """
+    (C, C + 1) counts of true class (rows) against top-1 prediction
+    (columns), the last column counting images without detection. Images
+    without ground truth are left out.
+    """
+    valid = _valid(truth, predicted, num_classes)
+    columns = np.where(predicted[valid] == NO_CLASS, num_classes, predicted[valid])
+    flat = truth[valid].astype(np.int64) * (num_classes + 1) + columns
+    counts = np.bincount(flat, minlength=num_classes * (num_classes + 1))
+    return counts.reshape(num_classes, num_classes + 1)
+
+
+def per_class_metrics(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Precision, recall, F1 and support per class from a `confusion_matrix`.
+    Missed images (no detection) count against recall only.
+    """
+    num_classes = matrix.shape[0]
+    tp = np.diag(matrix[:, :num_classes])
+    precision = _divide(tp, matrix[:, :num_classes].sum(axis=0))
+    recall = _divide(tp, matrix.sum(axis=1))
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": _divide(2 * precision * recall, precision + recall),
+        "support": matrix.sum(axis=1),
+    }
+
+
+def calibration_curve(
+    confidences: np.ndarray, correct: np.ndarray, bins: int = 10
+) -> Dict[str, np.ndarray]:
+    """
+    Reliability diagram over `bins` equal confidence bins: images, mean
+    confidence and accuracy per bin, and the expected calibration error.
+    """
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    index = np.searchsorted(edges[1:-1], confidences, side="left")
+    count = np.bincount(index, minlength=bins)
+    mean_conf = _divide(np.bincount(index, weights=confidences, minlength=bins), count)
+    accuracy = _divide(np.bincount(index, weights=correct, minlength=bins), count)
+    ece = float((count * np.abs(accuracy - mean_conf)).sum() / max(1, count.sum()))
+    return {
+        "edges": edges,
+        "count": count,
+        "confidence": mean_conf,
+        "accuracy": accuracy,
+        "ece": ece,
+    }
+
+
+def threshold_sweep(
+    truth: np.ndarray,
+    predicted: np.ndarray,
+    scores: np.ndarray,
+    thresholds: Sequence[float] = DEFAULT_SWEEP,
+    num_classes: int = len(CLASS_NAMES),
+) -> Dict[str, np.ndarray]:
+    """
+    Statistics for every confidence threshold at once, from the top-1 class
+    and confidence of each image: an image keeps its top-1 above the
+    threshold and has no detection below it. Per-class arrays are (T, C).
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    # (T, N): NaN scores (no detection) never pass
+    kept = scores[None, :] > thresholds[:, None]
+    known = _valid(truth, predicted, num_classes)
+    hit = known & (predicted == truth)
+
+    classes = np.arange(num_classes)
+    predicted_onehot = (predicted[:, None] == classes) & known[:, None]
+    true_onehot = (truth[:, None] == classes) & known[:, None]
+    kept_f = kept.astype(np.float64)
+    tp = kept_f @ (predicted_onehot & true_onehot)
+    precision = _divide(tp, kept_f @ predicted_onehot)
+    recall = _divide(tp, true_onehot.sum(axis=0))
+    f1 = _divide(2 * precision * recall, precision + recall)
+
+    total = len(scores)
+    return {
+        "conf": thresholds,
+        "detection_rate": _divide(kept.sum(axis=1) * 100.0, total),
+        "accuracy": _divide((kept & hit).sum(axis=1) * 100.0, known.sum()),
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "macro_f1": f1.mean(axis=1),
+    }
+
+
+def evaluate_table(
+    table: DetectionTable,
+    thresholds: Optional[Sequence[float]] = None,
+    bins: int = 10,
+) -> Dict:
+    """
+    Full evaluation of a `DetectionTable` as a JSON-ready dict: summary (as
+    `evaluate_batch`), confusion matrix, per-class metrics, calibration and
+    a confidence sweep with the threshold of best macro F1. Thresholds below
+    the `conf` the table was predicted at report the same figures as it.
+    Images that failed are left out, as in the summary.
+    """
+    num_classes = len(CLASS_NAMES)
+    names = [CLASS_NAMES[cid] for cid in range(num_classes)]
+    readable = table.readable()
+    predicted, scores = table.top1()
+    predicted, scores = predicted[readable], scores[readable]
+    truth = table.ground_truth[readable]
+
+    matrix = confusion_matrix(truth, predicted, num_classes)
+    metrics = per_class_metrics(matrix)
+    judged = _valid(truth, predicted, num_classes) & (predicted != NO_CLASS)
+    calibration = calibration_curve(
+        scores[judged].astype(np.float64), (predicted == truth)[judged], bins
+    )
+    sweep = threshold_sweep(
+        truth,
+        predicted,
+        scores,
+        DEFAULT_SWEEP if thresholds is None else thresholds,
+        num_classes,
+    )
+    best = int(np.argmax(sweep["macro_f1"])) if len(sweep["conf"]) else None
+
+    return {
+        "summary": table.summary(),
+        "classes": names,
+        "confusion_matrix": matrix.tolist(),
+        "per_class": {
+            name: {key: values[cid].item() for key, values in metrics.items()}
+            for cid, name in enumerate(names)
+        },
+        "macro_f1": float(metrics["f1"].mean()),
+        "calibration": {
+            key: value.tolist() if isinstance(value, np.ndarray) else value
+            for key, value in calibration.items()
+        },
+        "sweep": {key: np.round(value, 4).tolist() for key, value in sweep.items()},
+        "best_conf": round(float(sweep["conf"][best]), 4) if best is not None else None,
+    }
+
+
+def _row(label: str, values: Sequence, fmt: str, width: int = 12) -> str:
+    return f"{label:<14}" + "".join(f"{v:>{width}{fmt}}" for v in values)
+
+
+def format_report(report: Dict) -> List[str]:
+    """
+    Table lines for an `evaluate_table` report, for CLI output.
+    """
+    names = report["classes"]
+    short = [name[:11] for name in names]
+    lines = ["Confusion matrix (rows: ground truth, columns: top-1 prediction):"]
+    lines.append(_row("", short + ["none"], "s"))
+    for name, row in zip(short, report["confusion_matrix"]):
+        lines.append(_row(name, row, "d"))
+
+    lines.append("Per class:")
+    lines.append(_row("", ["precision", "recall", "f1", "support"], "s"))
+    for name, metrics in report["per_class"].items():
+        values = [metrics["precision"], metrics["recall"], metrics["f1"]]
+        lines.append(_row(name[:13], values, ".3f") + f"{metrics['support']:>12d}")
+    lines.append(f"Macro F1: {report['macro_f1']:.3f}")
+
+    calibration = report["calibration"]
+    lines.append(f"Calibration (expected calibration error {calibration['ece']:.3f}):")
+    lines.append(_row("confidence", ["images", "mean conf", "accuracy"], "s"))
+    edges = calibration["edges"]
+    for i, count in enumerate(calibration["count"]):
+        if count:
+            label = f"{edges[i]:.1f}-{edges[i + 1]:.1f}"
+            values = [calibration["confidence"][i], calibration["accuracy"][i]]
+            lines.append(f"{label:<14}{count:>12d}" + "".join(f"{v:>12.3f}" for v in values))
+
+    sweep = report["sweep"]
+    lines.append("Confidence sweep:")
+    lines.append(_row("conf", ["detected %", "accuracy %", "macro f1"], "s"))
+    for conf, rate, accuracy, f1 in zip(
+        sweep["conf"], sweep["detection_rate"], sweep["accuracy"], sweep["macro_f1"]
+    ):
+        lines.append(f"{conf:<14.3g}{rate:>12.1f}{accuracy:>12.1f}{f1:>12.3f}")
+    if report["best_conf"] is not None:
+        lines.append(f"Best macro F1 at conf={report['best_conf']:.3g}")
+    return lines
@@ -0,0 +1,160 @@
+"""
+HTTP image fetching with a persistent connection pool, a download size cap
+and concurrent batch downloads.
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Same limit as the Flask upload size
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+class DownloadTooLarge(ValueError):
+    """Raised when a response exceeds the fetcher's `max_bytes`."""
+
+
+class ImageFetcher:
+    """
+    Downloads images through one `requests.Session`, reusing connections
+    across calls. Bodies are streamed and aborted beyond `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        timeout: float = 10.0,
+        pool_size: int = 16,
+    ):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Returns the body of `url`, raising `DownloadTooLarge` past `max_bytes`.
+        """
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise DownloadTooLarge(
+                    f"{url} is {int(declared)} bytes (limit {self.max_bytes})"
+                )
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise DownloadTooLarge(f"{url} exceeds {self.max_bytes} bytes")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    @contextmanager
+    def fetch_to_file(self, url: str) -> Iterator[Path]:
+        """
+        Downloads `url` to a temporary file that is removed on exit.
+        """
+        suffix = Path(urlparse(url).path).suffix or ".jpg"
+        fd, name = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.fetch(url))
+            yield Path(name)
+        finally:
+            try:
+                os.unlink(name)
+            except FileNotFoundError:
+                pass
+
+    def fetch_many(
+        self,
+        urls: Iterable[str],
+        workers: Optional[int] = None,
+        queue_depth: Optional[int] = None,
+    ) -> Iterator[Tuple[str, Optional[bytes], Optional[Exception]]]:
+        """
+        Downloads `urls` concurrently and yields (url, body, error) as each
+        download completes, so consumers can start on the first ones while the
+        rest are still in flight. Exactly one of body / error is set.
+
+        At most `queue_depth` downloads (default twice `workers`) are in
+        flight or finished but not yet consumed, so a long URL list never
+        holds more than that many bodies in memory.
+        """
+        workers = workers or self.pool_size
+        queue_depth = max(workers, queue_depth or 2 * workers)
+        urls = iter(urls)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spatial-fetch") as pool:
+            futures: Dict[Future, str] = {}
+            try:
+                while True:
+                    for url in islice(urls, queue_depth - len(futures)):
+                        futures[pool.submit(self.fetch, url)] = url
+                    if not futures:
+                        return
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url = futures.pop(future)
+                        try:
+                            yield url, future.result(), None
+                        except Exception as exc:
+                            yield url, None, exc
+            finally:
+                # Consumer stopped early: drop the downloads not started yet
+                for future in futures:
+                    future.cancel()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_fetcher: Optional[ImageFetcher] = None
+_default_fetcher_lock = threading.Lock()
+
+
+def default_fetcher() -> ImageFetcher:
+    """
+    Process-wide fetcher shared by `download_bytes` / `download_image`.
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = ImageFetcher()
+        return _default_fetcher
+
+
+def url_stem(url: str, default: str = "url") -> str:
+    """
+    File-name friendly stem of a URL path, used to name annotated outputs.
+    """
+    return Path(urlparse(url).path).stem or default
+
+
+def read_url_list(path: Path) -> Iterator[str]:
+    """
+    Yields the URLs of a text file, one per line (blank lines and # comments
+    are skipped).
+    """
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
@@ -0,0 +1,104 @@
+"""
+Image decoding helpers shared by dataset tooling and inference.
+"""
+
+import io
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def read_image(path: Path):
+    """
+    Decodes an image from disk as a BGR array, the layout Ultralytics expects
+    for in-memory sources.
+    """
+    image = cv2.imread(str(path))
+    if image is None:
+        raise ValueError(f"Unable to read image: {path}")
+    return image
+
+
+def decode_bytes(data: bytes):
+    """
+    Decodes encoded image bytes (JPEG, PNG...) to a BGR array in memory.
+    Formats OpenCV cannot read (GIF...) go through Pillow when available.
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is not None:
+        return image
+
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ValueError("Unable to decode image bytes")
+    try:
+        rgb = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+    except Exception as exc:
+        raise ValueError(f"Unable to decode image bytes: {exc}")
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def encode_jpeg(image, quality: int = 90) -> bytes:
+    """
+    Encodes a BGR array as JPEG bytes.
+    """
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Unable to encode image as JPEG")
+    return buffer.tobytes()
+
+
+def letterbox(image, size: int, color: Tuple[int, int, int] = (114, 114, 114)):
+    """
+    Resizes an image to fit a `size` x `size` square while keeping its aspect
+    ratio, padding the borders with `color` as YOLO does.
+    Returns the padded image, the scale factor and the (left, top) padding.
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_h, new_w = int(round(h * scale)), int(round(w * scale))
+    if (new_h, new_w) != (h, w):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    top = (size - new_h) // 2
+    left = (size - new_w) // 2
+    padded = cv2.copyMakeBorder(
+        image,
+        top,
+        size - new_h - top,
+        left,
+        size - new_w - left,
+        cv2.BORDER_CONSTANT,
+        value=color,
+    )
+    return padded, scale, (left, top)
+
+
+def decode_image(path: Path, imgsz: Optional[int] = None):
+    """
+    Reads an image and letterboxes it to `imgsz` when given.
+    Returns the frame and the (height, width) of the original image.
+    """
+    image = read_image(path)
+    shape = image.shape[:2]
+    if imgsz:
+        image, _, _ = letterbox(image, imgsz)
+    return image, shape
+
+
+def unletterbox_boxes(xyxy: np.ndarray, shape: Tuple[int, int], size: int) -> np.ndarray:
+    """
+    Maps xyxy boxes predicted on `letterbox(image, size)` back to pixels of
+    the original image of (height, width) `shape`, clipped to it.
+    """
+    h, w = shape
+    scale = min(size / h, size / w)
+    left = (size - int(round(w * scale))) // 2
+    top = (size - int(round(h * scale))) // 2
+    boxes = (xyxy - np.array([left, top, left, top], dtype=xyxy.dtype)) / scale
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, w)
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, h)
+    return boxes.astype(xyxy.dtype, copy=False)
@@ -1,147 +1,1264 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sys
 import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
 
 import cv2
-import requests
+import numpy as np
 
-from .data import CLASS_NAMES
+from .data import CLASS_NAMES, ImageCache, read_label
+from .evaluation import label_map
+from .fetch import ImageFetcher, default_fetcher, url_stem
+from .imaging import (
+    decode_bytes,
+    decode_image,
+    encode_jpeg,
+    letterbox,
+    read_image,
+    unletterbox_boxes,
+)
+from .results import DetectionTable
+from .timing import StageTimer, timed
 
 
-def load_model(model_path: Path):
+def load_model(model_path: Path, threads: Optional[int] = None):
     """
-    Delayed import to avoid pulling torch when unused.
+    Loads a detector by file type: `.onnx` exports run on onnxruntime
+    (`threads` caps its thread pool), anything else through Ultralytics.
+    Delayed imports avoid pulling torch when unused.
     """
+    if Path(model_path).suffix.lower() == ".onnx":
+        from .onnx_backend import OnnxModel
+
+        return OnnxModel(Path(model_path), threads=threads)
+
     from ultralytics import YOLO
 
     return YOLO(str(model_path))
 
 
+def warmup_model(model, imgsz: int = 416) -> None:
+    """
+    Runs one forward pass on a blank frame so lazy initialisation (predictor
+    setup, kernel selection) happens before the first real request.
+    """
+    model.predict(
+        source=np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False
+    )
+
+
+class ModelManager:
+    """
+    Keeps recently used models loaded, keyed by resolved path and mtime (a
+    retrained file is reloaded), evicting the least recently used beyond
+    `capacity`. One model is the serving model: `swap()` loads and warms the
+    new one first, then replaces it atomically, so callers that already hold
+    the previous model finish their request with it.
+    """
+
+    def __init__(self, capacity: int = 2, warmup: bool = True, warmup_size: int = 416):
+        self.capacity = max(1, capacity)
+        self.warmup = warmup
+        self.warmup_size = warmup_size
+        self._models: "OrderedDict[Tuple[str, float], object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._current = None
+        self._current_path: Optional[Path] = None
+        self._current_id: Optional[str] = None
+
+    @staticmethod
+    def _key(model_path: Path) -> Tuple[str, float]:
+        resolved = Path(model_path).resolve()
+        return str(resolved), resolved.stat().st_mtime
+
+    def get(self, model_path: Path):
+        """
+        Returns the model for `model_path`, loading (and warming) it on a miss.
+        """
+        key = self._key(model_path)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+        # Loads are serialised but never block lookups or the serving model
+        with self._load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+            model = load_model(Path(model_path))
+            if self.warmup:
+                warmup_model(model, self.warmup_size)
+            with self._lock:
+                self._models[key] = model
+                while len(self._models) > self.capacity:
+                    self._models.popitem(last=False)
+        return model
+
+    def swap(self, model_path: Path):
+        """
+        Makes `model_path` the serving model and returns it.
+        """
+        key = self._key(model_path)
+        model = self.get(model_path)
+        with self._lock:
+            self._current = model
+            self._current_path = Path(model_path)
+            self._current_id = f"{key[0]}@{key[1]}"
+        return model
+
+    @property
+    def current(self):
+        with self._lock:
+            if self._current is None:
+                raise RuntimeError("No model loaded; call swap() first.")
+            return self._current
+
+    def snapshot(self) -> Tuple[object, str]:
+        """
+        The serving model and its `current_id`, read together, so a result
+        is never cached under the id of a model that did not compute it.
+        """
+        with self._lock:
+            if self._current is None:
+                raise RuntimeError("No model loaded; call swap() first.")
+            return self._current, self._current_id
+
+    @property
+    def current_id(self) -> Optional[str]:
+        """
+        Identity of the serving model (resolved path and mtime), suitable as a
+        cache key component.
+        """
+        with self._lock:
+            return self._current_id
+
+    @property
+    def current_path(self) -> Optional[Path]:
+        with self._lock:
+            return self._current_path
+
+    def cached(self) -> List[str]:
+        with self._lock:
+            return [path for path, _ in self._models]
+
+
+# Annotation modes: render and write synchronously, hand off to a background
+# AnnotationWriter, or skip rendering entirely (stats only).
+ANNOTATE_MODES = ("sync", "async", "none")
+# Default of the batch front ends (CLI, GUI): larger runs skip annotated
+# images unless asked for.
+ANNOTATE_LIMIT = 100
+
+
+def _write_annotated(res, out_path: Path, timer: Optional[StageTimer] = None) -> None:
+    with timed(timer, "plot"):
+        annotated = res.plot()  # BGR numpy array
+    with timed(timer, "write"):
+        if not cv2.imwrite(str(out_path), annotated):
+            raise OSError(f"Unable to write annotated image: {out_path}")
+
+
+class AnnotationWriter:
+    """
+    Renders (`res.plot()`) and writes annotated predictions on a background
+    thread pool so the inference loop does not block on drawing or disk I/O.
+    At most `max_pending` results are queued; `close()` waits for the rest and
+    re-raises the first write error, if any. Failures are counted in
+    `failed`; only the first `max_errors` not yet drained are kept.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 64, max_errors: int = 16):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="spatial-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._errors: List[BaseException] = []
+        self.max_errors = max(1, max_errors)
+        self.failed = 0
+
+    def submit(self, res, out_path: Path, timer: Optional[StageTimer] = None) -> None:
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(_write_annotated, res, out_path, timer)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future) -> None:
+        self._slots.release()
+        exc = future.exception()
+        if exc is not None:
+            with self._lock:
+                self.failed += 1
+                if len(self._errors) < self.max_errors:
+                    self._errors.append(exc)
+
+    def drain_errors(self) -> List[BaseException]:
+        """
+        Write errors kept since the last call, without stopping the writer.
+        """
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self) -> "AnnotationWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_default_writer: Optional[AnnotationWriter] = None
+_default_writer_lock = threading.Lock()
+
+
+def _shared_writer() -> AnnotationWriter:
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = AnnotationWriter()
+        return _default_writer
+
+
+def annotation_errors() -> List[BaseException]:
+    """
+    Errors of the shared background writer used by `predict_image(...,
+    annotate="async")` without a `writer`, since the last call. Failures
+    still undrained at exit are reported on stderr.
+    """
+    with _default_writer_lock:
+        writer = _default_writer
+    return writer.drain_errors() if writer is not None else []
+
+
+@atexit.register
+def _close_shared_writer() -> None:
+    with _default_writer_lock:
+        writer = _default_writer
+    if writer is None:
+        return
+    writer._pool.shutdown(wait=True)
+    errors = writer.drain_errors()
+    if errors:
+        print(
+            f"spatial: {writer.failed} annotated image(s) could not be written "
+            f"in the background (first error: {errors[0]})",
+            file=sys.stderr,
+        )
+
+
+def _annotate(
+    res,
+    out_path: Path,
+    annotate: str,
+    writer: Optional[AnnotationWriter] = None,
+    timer: Optional[StageTimer] = None,
+) -> Optional[Path]:
+    """
+    Applies an annotation mode to a result; returns the path the annotated
+    image is (or will be) written to, or None when annotation is skipped.
+    """
+    if annotate not in ANNOTATE_MODES:
+        raise ValueError(f"annotate must be one of {ANNOTATE_MODES}, got {annotate!r}")
+    if annotate == "none":
+        return None
+    if annotate == "async":
+        (writer or _shared_writer()).submit(res, out_path, timer)
+    else:
+        _write_annotated(res, out_path, timer)
+    return out_path
+
+
+# Anything predict_image accepts: a file path, a decoded BGR array or the
+# encoded bytes of an image (e.g. an HTTP upload).
+ImageSource = Union[Path, str, np.ndarray, bytes]
+
+
+def _model_source(source: ImageSource):
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return decode_bytes(bytes(source))
+    return str(source)
+
+
+def detections_from_result(res) -> List[Dict]:
+    """
+    Converts an Ultralytics result into the list of detection dicts returned
+    by `predict_image` (box in xyxy pixels of the input image).
+    """
+    detections: List[Dict] = []
+    xyxy, scores, classes = result_arrays(res)
+    for box, score, cls_id in zip(xyxy.tolist(), scores.tolist(), classes.tolist()):
+        cid = int(cls_id)
+        detections.append(
+            {
+                "class_id": cid,
+                "class_name": CLASS_NAMES.get(cid, str(cid)),
+                "confidence": float(score),
+                "box": [float(v) for v in box],
+            }
+        )
+    return detections
+
+
+def result_arrays(res) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Boxes of an Ultralytics result as NumPy arrays: xyxy (N, 4) float32 in
+    pixels of the frame given to the model (see `unletterbox_boxes` for
+    letterboxed frames), confidences (N,) float32, class ids (N,) int64.
+    """
+    if res.boxes is None or len(res.boxes) == 0:
+        return (
+            np.zeros((0, 4), dtype=np.float32),
+            np.zeros(0, dtype=np.float32),
+            np.zeros(0, dtype=np.int64),
+        )
+
+    def _numpy(values):
+        return values.cpu().numpy() if hasattr(values, "cpu") else np.asarray(values)
+
+    return (
+        _numpy(res.boxes.xyxy).astype(np.float32),
+        _numpy(res.boxes.conf).astype(np.float32),
+        _numpy(res.boxes.cls).astype(np.int64),
+    )
+
+
 def predict_image(
     model,
-    source: Path,
+    source: ImageSource,
     save_dir: Path,
     conf: float = 0.10,
     iou: float = 0.45,
-) -> Tuple[Path, List[Dict]]:
+    annotate: str = "sync",
+    writer: Optional[AnnotationWriter] = None,
+    name: Optional[str] = None,
+    timer: Optional[StageTimer] = None,
+) -> Tuple[Optional[Path], List[Dict]]:
     """
     Runs inference on a single image and writes an annotated copy.
     Returns the output path and a list of detections with confidences.
+    `source` may be a path, a BGR array or encoded image bytes; the copy is
+    named after `name` (default: the file stem, or "image").
+    With `annotate="async"` the copy is written by `writer` (or a shared
+    background writer, whose errors `annotation_errors()` returns); with
+    `annotate="none"` nothing is written and the returned path is None.
+    `timer` records the stage timings of the call.
     """
     save_dir.mkdir(parents=True, exist_ok=True)
-    results = model.predict(source=str(source), conf=conf, iou=iou, verbose=False)
+    with timed(timer, "read"):
+        frame = _model_source(source)
+        if not isinstance(frame, np.ndarray):
+            frame = read_image(Path(frame))
+    results = model.predict(source=frame, conf=conf, iou=iou, verbose=False)
     res = results[0]
+    if timer is not None:
+        timer.record_speed(res)
 
-    annotated = res.plot()  # BGR numpy array
-    out_path = save_dir / f"{Path(source).stem}_pred.jpg"
-    cv2.imwrite(str(out_path), annotated)
+    if name is None:
+        name = Path(source).stem if isinstance(source, (str, Path)) else "image"
+    out_path = _annotate(res, save_dir / f"{name}_pred.jpg", annotate, writer, timer)
 
-    detections: List[Dict] = []
-    if res.boxes is not None and len(res.boxes) > 0:
-        for cls_id, score in zip(res.boxes.cls.tolist(), res.boxes.conf.tolist()):
-            cid = int(cls_id)
-            detections.append(
-                {
-                    "class_id": cid,
-                    "class_name": CLASS_NAMES.get(cid, str(cid)),
-                    "confidence": float(score),
-                }
+    return out_path, detections_from_result(res)
+
+
+def predict_images_bytes(
+    model,
+    frames: Sequence[np.ndarray],
+    conf: float = 0.10,
+    iou: float = 0.45,
+    annotate: bool = True,
+    quality: int = 90,
+) -> List[Tuple[Optional[bytes], List[Dict]]]:
+    """
+    `predict_image_bytes` for several decoded frames in one `model.predict`
+    call.
+    """
+    results = model.predict(source=list(frames), conf=conf, iou=iou, verbose=False)
+    return [
+        (encode_jpeg(res.plot(), quality) if annotate else None, detections_from_result(res))
+        for res in results
+    ]
+
+
+def predict_image_bytes(
+    model,
+    source: ImageSource,
+    conf: float = 0.10,
+    iou: float = 0.45,
+    annotate: bool = True,
+    quality: int = 90,
+) -> Tuple[Optional[bytes], List[Dict]]:
+    """
+    In-memory variant of `predict_image`: nothing touches the filesystem.
+    Returns the annotated image as JPEG bytes (None if `annotate` is False)
+    and the list of detections.
+    """
+    results = model.predict(
+        source=_model_source(source), conf=conf, iou=iou, verbose=False
+    )
+    res = results[0]
+    encoded = encode_jpeg(res.plot(), quality) if annotate else None
+    return encoded, detections_from_result(res)
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of `predict_image_bytes` results.
+
+    Entries are keyed by the SHA-256 of the image content, the model identity
+    and the conf/iou thresholds. A bounded in-memory LRU tier answers repeats
+    directly; the optional `disk_dir` tier persists entries across restarts.
+    URLs are remembered for `url_ttl` seconds, so a popular URL is neither
+    re-downloaded nor re-predicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        disk_dir: Optional[Path] = None,
+        url_ttl: float = 3600.0,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = disk_dir
+        self.url_ttl = url_ttl
+        if disk_dir is not None:
+            disk_dir.mkdir(parents=True, exist_ok=True)
+        self._memory: "OrderedDict[str, Tuple[Optional[bytes], List[Dict]]]" = OrderedDict()
+        self._urls: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def content_digest(data) -> str:
+        """
+        SHA-256 of encoded image bytes, or of a decoded array and its shape.
+        """
+        if isinstance(data, np.ndarray):
+            digest = hashlib.sha256(str(data.shape).encode())
+            digest.update(np.ascontiguousarray(data).data)
+            return digest.hexdigest()
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _key(digest: str, model_id: str, conf: float, iou: float, annotate: bool) -> str:
+        raw = f"{digest}|{model_id}|{conf:.4f}|{iou:.4f}|{int(annotate)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Optional[bytes], List[Dict]]]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counts["memory_hits"] += 1
+                return self._memory[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self._counts["misses"] += 1
+                return None
+            self._counts["disk_hits"] += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Tuple[Optional[bytes], List[Dict]]) -> None:
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def _remember(self, key: str, value: Tuple[Optional[bytes], List[Dict]]) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Tuple[Optional[bytes], List[Dict]]]:
+        if self.disk_dir is None:
+            return None
+        meta_path = self.disk_dir / f"{key}.json"
+        if not meta_path.exists():
+            return None
+        try:
+            with open(meta_path, "r") as f:
+                detections = json.load(f)
+            image_path = self.disk_dir / f"{key}.jpg"
+            encoded = image_path.read_bytes() if image_path.exists() else None
+        except (OSError, ValueError):
+            return None
+        return encoded, detections
+
+    def _write_disk(self, key: str, value: Tuple[Optional[bytes], List[Dict]]) -> None:
+        if self.disk_dir is None:
+            return
+        encoded, detections = value
+        if encoded is not None:
+            (self.disk_dir / f"{key}.jpg").write_bytes(encoded)
+        # Metadata last: its presence marks a complete entry
+        tmp = self.disk_dir / f"{key}.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(detections, f)
+        tmp.replace(self.disk_dir / f"{key}.json")
+
+    def predict(
+        self,
+        model,
+        source: ImageSource,
+        model_id: str,
+        conf: float = 0.10,
+        iou: float = 0.45,
+        annotate: bool = True,
+    ) -> Tuple[Optional[bytes], List[Dict]]:
+        """
+        Cached `predict_image_bytes`. Paths are read once and their bytes are
+        both hashed and handed to the model.
+        """
+        if isinstance(source, (str, Path)):
+            source = Path(source).read_bytes()
+        return self._predict_digest(
+            model, source, self.content_digest(source), model_id, conf, iou, annotate
+        )
+
+    def predict_url(
+        self,
+        model,
+        url: str,
+        model_id: str,
+        conf: float = 0.10,
+        iou: float = 0.45,
+        annotate: bool = True,
+        fetch: Optional[Callable[[str], bytes]] = None,
+    ) -> Tuple[Optional[bytes], List[Dict]]:
+        """
+        Cached prediction for a URL: a URL seen within `url_ttl` is answered
+        without downloading it again.
+        """
+        value = self.lookup_url(url, model_id, conf, iou, annotate)
+        if value is not None:
+            return value
+
+        data = (fetch or download_bytes)(url)
+        digest = self.content_digest(data)
+        self._remember_url(url, digest)
+        return self._predict_digest(model, data, digest, model_id, conf, iou, annotate)
+
+    def _remember_url(self, url: str, digest: str) -> None:
+        with self._lock:
+            self._urls[url] = (digest, time.monotonic())
+            self._urls.move_to_end(url)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+
+    def predict_many(
+        self,
+        model,
+        sources: Sequence[ImageSource],
+        model_id: str,
+        conf: float = 0.10,
+        iou: float = 0.45,
+        annotate: bool = True,
+    ) -> List[Union[Tuple[Optional[bytes], List[Dict]], Exception]]:
+        """
+        Cached predictions for several images: hits are answered directly and
+        all misses go through a single `model.predict` call (one batch, or
+        micro-batches with a `MicroBatcher`). An image that cannot be read or
+        decoded gets its exception in place of a result.
+        """
+        results: List = [None] * len(sources)
+        frames = []
+        for i, source in enumerate(sources):
+            try:
+                if isinstance(source, (str, Path)):
+                    source = Path(source).read_bytes()
+                key = self._key(self.content_digest(source), model_id, conf, iou, annotate)
+                value = self.get(key)
+                if value is None:
+                    frames.append((i, key, decode_bytes(source)))
+                else:
+                    results[i] = value
+            except (OSError, ValueError) as exc:
+                results[i] = exc
+
+        if frames:
+            values = predict_images_bytes(
+                model, [frame for _, _, frame in frames], conf=conf, iou=iou, annotate=annotate
             )
+            for (i, key, _), value in zip(frames, values):
+                self.put(key, value)
+                results[i] = value
+        return results
+
+    def predict_many_urls(
+        self,
+        model,
+        urls: Sequence[str],
+        model_id: str,
+        conf: float = 0.10,
+        iou: float = 0.45,
+        annotate: bool = True,
+        fetcher: Optional[ImageFetcher] = None,
+        fetched: Optional[Dict[str, Union[bytes, Exception]]] = None,
+        download_workers: int = 8,
+    ) -> List[Union[Tuple[Optional[bytes], List[Dict]], Exception]]:
+        """
+        `predict_many` for URLs. URLs seen within `url_ttl` are answered from
+        the cache; the others are downloaded concurrently, unless the caller
+        already did (`fetched`: body or download error per URL). A failed
+        download gets its exception in place of a result.
+        """
+        results: List = [None] * len(urls)
+        missing: Dict[str, List[int]] = {}
+        for i, url in enumerate(urls):
+            value = self.lookup_url(url, model_id, conf, iou, annotate)
+            if value is None:
+                missing.setdefault(url, []).append(i)
+            else:
+                results[i] = value
 
-    return out_path, detections
+        bodies = {url: fetched[url] for url in missing if fetched and url in fetched}
+        to_fetch = [url for url in missing if url not in bodies]
+        if to_fetch:
+            for url, data, error in (fetcher or default_fetcher()).fetch_many(
+                to_fetch, workers=download_workers
+            ):
+                bodies[url] = data if error is None else error
+
+        downloaded = []
+        for url, body in bodies.items():
+            if isinstance(body, Exception):
+                for i in missing[url]:
+                    results[i] = body
+            else:
+                self._remember_url(url, self.content_digest(body))
+                downloaded.append((url, body))
+
+        values = self.predict_many(
+            model, [body for _, body in downloaded], model_id, conf, iou, annotate
+        )
+        for (url, _), value in zip(downloaded, values):
+            for i in missing[url]:
+                results[i] = value
+        return results
+
+    def lookup_url(
+        self,
+        url: str,
+        model_id: str,
+        conf: float = 0.10,
+        iou: float = 0.45,
+        annotate: bool = True,
+    ) -> Optional[Tuple[Optional[bytes], List[Dict]]]:
+        """
+        Cached prediction for a URL seen within `url_ttl`, or None (without
+        downloading anything), e.g. to skip a fetch before `predict_url`.
+        """
+        with self._lock:
+            known = self._urls.get(url)
+        if known is None or time.monotonic() - known[1] >= self.url_ttl:
+            return None
+        return self.get(self._key(known[0], model_id, conf, iou, annotate))
+
+    def _predict_digest(self, model, data, digest, model_id, conf, iou, annotate):
+        key = self._key(digest, model_id, conf, iou, annotate)
+        value = self.get(key)
+        if value is None:
+            value = predict_image_bytes(model, data, conf=conf, iou=iou, annotate=annotate)
+            self.put(key, value)
+        return value
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters and current size of the memory tier.
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            counts["entries"] = len(self._memory)
+        lookups = counts["memory_hits"] + counts["disk_hits"] + counts["misses"]
+        counts["hit_rate"] = (
+            (counts["memory_hits"] + counts["disk_hits"]) / lookups if lookups else 0.0
+        )
+        return counts
+
+
+def download_bytes(url: str) -> bytes:
+    """
+    Downloads an image and returns its raw (encoded) bytes, through the shared
+    pooled `ImageFetcher` (size-capped streaming download).
+    """
+    return default_fetcher().fetch(url)
+
+
+_temp_downloads: List[Path] = []
+
+
+@atexit.register
+def _remove_temp_downloads() -> None:
+    for path in _temp_downloads:
+        try:
+            path.unlink()
+        except OSError:
+            pass
 
 
 def download_image(url: str) -> Path:
     """
-    Downloads an image to a temporary file and returns its path.
+    Downloads an image to a temporary file and returns its path. The file is
+    removed when the process exits; prefer `download_bytes` (predict_image
+    accepts bytes) or `ImageFetcher.fetch_to_file` for scoped files.
     """
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(url, headers=headers, timeout=10)
-    response.raise_for_status()
+    content = download_bytes(url)
 
-    suffix = Path(url).suffix or ".jpg"
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp.write(response.content)
-    tmp.flush()
-    return Path(tmp.name)
+    suffix = Path(urlparse(url).path).suffix or ".jpg"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(content)
+    path = Path(tmp.name)
+    _temp_downloads.append(path)
+    return path
 
 
-def evaluate_batch(
+_QUEUE_DONE = object()
+
+
+def prefetch_images(
+    paths: Iterable[Path],
+    workers: int = 2,
+    queue_depth: int = 32,
+    imgsz: Optional[int] = None,
+    timer: Optional[StageTimer] = None,
+) -> Iterator[Tuple[Path, object, Optional[Tuple[int, int]]]]:
+    """
+    Decodes (and optionally letterboxes to `imgsz`) images on a thread pool
+    ahead of the consumer, so disk/JPEG work overlaps with inference.
+
+    At most `queue_depth` images are in flight at any time. Results are yielded
+    as (path, BGR array, original (height, width) when letterboxed, else
+    None) in input order; `workers=0` decodes inline. An image that cannot
+    be read or decoded is yielded with its exception in place of the array,
+    so one corrupt file does not end the run.
+    """
+
+    def _decode(path: Path):
+        with timed(timer, "read"):
+            try:
+                frame, shape = decode_image(path, imgsz)
+            except (OSError, ValueError) as exc:
+                return exc, None
+        return frame, shape if imgsz else None
+
+    if workers <= 0:
+        for path in paths:
+            path = Path(path)
+            yield (path, *_decode(path))
+        return
+
+    pending: "queue.Queue" = queue.Queue(maxsize=max(1, queue_depth))
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spatial-decode")
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for path in paths:
+                path = Path(path)
+                if not _put((path, pool.submit(_decode, path))):
+                    return
+        except Exception as exc:  # surfaced to the consumer
+            _put(exc)
+        finally:
+            _put(_QUEUE_DONE)
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _QUEUE_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            path, future = item
+            yield (path, *future.result())
+    finally:
+        stop.set()
+        producer.join()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_batch_predictions(
     model,
-    images: Iterable[Path],
+    images: Union[Iterable[Path], ImageCache],
     save_dir: Path,
     label_dir: Optional[Path] = None,
     conf: float = 0.25,
     iou: float = 0.45,
-) -> Dict:
+    batch_size: int = 8,
+    decode_workers: int = 2,
+    queue_depth: int = 32,
+    imgsz: Optional[int] = None,
+    annotate: str = "sync",
+    timer: Optional[StageTimer] = None,
+    table: Optional[DetectionTable] = None,
+    max_det: Optional[int] = None,
+) -> Iterator[Dict]:
     """
-    Runs predictions on a set of images and aggregates simple statistics.
+    Predicts images in mini-batches of `batch_size` (one forward pass per
+    batch) and yields one result dict per image, in input order.
+    Decoding runs ahead of the model on `decode_workers` threads (see
+    `prefetch_images`); annotated copies follow `annotate` (see
+    `ANNOTATE_MODES`), `annotated_path` being None when skipped.
+    `images` may also be an `ImageCache`, whose memory-mapped frames and
+    labels are used directly (no decoding, `label_dir` ignored). Labels of
+    an image list are read up front in one pass; lazy iterables look them
+    up image by image.
+    `timer` records read / model / plot / write / label timings per image.
+    `table`, if given, receives every detection of every image (not only
+    the top-1 of the records), boxes in pixels of the original images even
+    when frames are letterboxed to `imgsz` (except from an `ImageCache`
+    built without original shapes); `max_det` overrides the model's cap on
+    detections per image.
     """
+    if annotate not in ANNOTATE_MODES:
+        raise ValueError(f"annotate must be one of {ANNOTATE_MODES}, got {annotate!r}")
     save_dir.mkdir(parents=True, exist_ok=True)
-    stats = {cid: 0 for cid in CLASS_NAMES.keys()}
-    total = 0
-    detected = 0
-    correct = 0
-    verifiable = 0
-    per_image: List[Dict] = []
+    batch_size = max(1, int(batch_size))
+    if isinstance(images, ImageCache):
+        decoded = images.iter_frames()
+        ground_truth = images.label_map().get
+        imgsz = imgsz or images.img_size
+    else:
+        decoded = prefetch_images(
+            images,
+            workers=decode_workers,
+            queue_depth=queue_depth,
+            imgsz=imgsz,
+            timer=timer,
+        )
+        ground_truth = partial(read_label, label_dir)
+        if label_dir and isinstance(images, Sequence):
+            ground_truth = label_map(label_dir, [Path(p).stem for p in images]).get
+    predict_kwargs = {"imgsz": imgsz} if imgsz else {}
+    if max_det:
+        predict_kwargs["max_det"] = max_det
+    yield from _predict_frames(
+        model,
+        ((str(path), path.stem, frame, shape) for path, frame, shape in decoded),
+        save_dir,
+        ground_truth,
+        conf,
+        iou,
+        batch_size,
+        predict_kwargs,
+        annotate,
+        timer,
+        table,
+    )
+
+
+def _predict_frames(
+    model,
+    items: Iterable[Tuple[str, str, object]],
+    save_dir: Path,
+    ground_truth: Callable[[str], Optional[int]],
+    conf: float,
+    iou: float,
+    batch_size: int,
+    predict_kwargs: Dict,
+    annotate: str,
+    timer: Optional[StageTimer] = None,
+    table: Optional[DetectionTable] = None,
+) -> Iterator[Dict]:
+    """
+    Shared batching loop: `items` are (image id, output stem, BGR frame,
+    original shape) tuples, the shape being given for letterboxed frames
+    only, so that `table` boxes are mapped back to the original image. A
+    frame may instead be an exception (failed download/decode), reported as
+    a record with an `error` field without calling the model.
+    """
+    writer = AnnotationWriter() if annotate == "async" else None
 
-    for img_path in images:
-        total += 1
+    def _flush(chunk: List[Tuple[str, str, object, Optional[Tuple[int, int]]]]) -> Iterator[Dict]:
         results = model.predict(
-            source=str(img_path),
+            source=[frame for _, _, frame, _ in chunk],
             conf=conf,
             iou=iou,
             verbose=False,
+            **predict_kwargs,
         )
-        res = results[0]
-        annotated = res.plot()
-        out_path = save_dir / f"{img_path.stem}_pred.jpg"
-        cv2.imwrite(str(out_path), annotated)
-
-        top_class = None
-        top_conf = None
-        if res.boxes is not None and len(res.boxes) > 0:
-            detected += 1
-            top_idx = int(res.boxes.cls[0])
-            top_class = top_idx
-            top_conf = float(res.boxes.conf[0])
-            stats[top_idx] = stats.get(top_idx, 0) + 1
-
-        true_class = None
-        if label_dir:
-            label_path = label_dir / f"{img_path.stem}.txt"
-            if label_path.exists():
-                with open(label_path, "r") as f:
-                    line = f.readline().strip()
-                    if line:
-                        true_class = int(line.split()[0])
-                        verifiable += 1
-                        if top_class is not None and top_class == true_class:
-                            correct += 1
-
-        per_image.append(
-            {
-                "image": str(img_path),
+        for (image_id, stem, frame, shape), res in zip(chunk, results):
+            if timer is not None:
+                timer.record_speed(res)
+            out_path = _annotate(
+                res, save_dir / f"{stem}_pred.jpg", annotate, writer, timer
+            )
+
+            top_class = None
+            top_conf = None
+            if res.boxes is not None and len(res.boxes) > 0:
+                top_class = int(res.boxes.cls[0])
+                top_conf = float(res.boxes.conf[0])
+
+            with timed(timer, "labels"):
+                true_class = ground_truth(stem)
+            if table is not None:
+                xyxy, scores, classes = result_arrays(res)
+                if shape is not None and len(xyxy):
+                    xyxy = unletterbox_boxes(xyxy, shape, frame.shape[0])
+                table.add(image_id, xyxy, scores, classes, ground_truth=true_class)
+
+            yield {
+                "image": image_id,
                 "prediction": top_class,
                 "prediction_name": CLASS_NAMES.get(top_class, None)
                 if top_class is not None
                 else None,
                 "confidence": top_conf,
                 "ground_truth": true_class,
-                "annotated_path": str(out_path),
+                "annotated_path": str(out_path) if out_path else None,
             }
-        )
 
-    detection_rate = (detected / total) * 100 if total else 0.0
-    accuracy = (correct / verifiable) * 100 if verifiable else 0.0
+    try:
+        chunk: List[Tuple[str, str, object, Optional[Tuple[int, int]]]] = []
+        for image_id, stem, frame, shape in items:
+            if isinstance(frame, Exception):
+                if table is not None:
+                    table.add(image_id, error=str(frame))
+                yield {
+                    "image": image_id,
+                    "prediction": None,
+                    "prediction_name": None,
+                    "confidence": None,
+                    "ground_truth": None,
+                    "annotated_path": None,
+                    "error": str(frame),
+                }
+                continue
+            chunk.append((image_id, stem, frame, shape))
+            if len(chunk) >= batch_size:
+                yield from _flush(chunk)
+                chunk = []
+        if chunk:
+            yield from _flush(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def iter_url_predictions(
+    model,
+    urls: Iterable[str],
+    save_dir: Path,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    batch_size: int = 8,
+    annotate: str = "none",
+    fetcher: Optional[ImageFetcher] = None,
+    download_workers: int = 8,
+) -> Iterator[Dict]:
+    """
+    Downloads `urls` concurrently and predicts them in mini-batches as the
+    downloads complete (completion order, not input order). Records use the
+    `iter_batch_predictions` format with the URL as `image`; failed downloads
+    or undecodable bodies carry an `error` field instead of a prediction.
+    """
+    if annotate not in ANNOTATE_MODES:
+        raise ValueError(f"annotate must be one of {ANNOTATE_MODES}, got {annotate!r}")
+    save_dir.mkdir(parents=True, exist_ok=True)
+    fetcher = fetcher or default_fetcher()
+
+    def _frames() -> Iterator[Tuple[str, str, object, None]]:
+        for i, (url, data, error) in enumerate(
+            fetcher.fetch_many(urls, workers=download_workers)
+        ):
+            if error is None:
+                try:
+                    frame = decode_bytes(data)
+                except ValueError as exc:
+                    frame = exc
+            else:
+                frame = error
+            # Index suffix keeps outputs apart when URLs share a file name
+            yield url, f"{url_stem(url)}_{i}", frame, None
+
+    yield from _predict_frames(
+        model,
+        _frames(),
+        save_dir,
+        lambda stem: None,
+        conf,
+        iou,
+        max(1, int(batch_size)),
+        {},
+        annotate,
+    )
+
 
-    return {
-        "total_images": total,
-        "detected_images": detected,
-        "detection_rate": detection_rate,
-        "accuracy": accuracy,
-        "counts": stats,
-        "verifiable": verifiable,
+class BatchStats:
+    """
+    Running `evaluate_batch` statistics, fed one result record at a time so
+    callers never need to keep the records. Instances can be merged, e.g.
+    across shards. Records of unreadable images (`error` field) are counted
+    as `errors` only, outside the images the rates are computed on.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {cid: 0 for cid in CLASS_NAMES.keys()}
+        self.total = 0
+        self.detected = 0
+        self.correct = 0
+        self.verifiable = 0
+        self.errors = 0
+
+    def add(self, item: Dict) -> None:
+        if item.get("error") is not None:
+            self.errors += 1
+            return
+        self.total += 1
+        top_class = item["prediction"]
+        if top_class is not None:
+            self.detected += 1
+            self.counts[top_class] = self.counts.get(top_class, 0) + 1
+
+        true_class = item["ground_truth"]
+        if true_class is not None:
+            self.verifiable += 1
+            if top_class is not None and top_class == true_class:
+                self.correct += 1
+
+    def merge(self, other: "BatchStats") -> "BatchStats":
+        for cid, count in other.counts.items():
+            self.counts[cid] = self.counts.get(cid, 0) + count
+        self.total += other.total
+        self.detected += other.detected
+        self.correct += other.correct
+        self.verifiable += other.verifiable
+        self.errors += other.errors
+        return self
+
+    def summary(self) -> Dict:
+        return {
+            "total_images": self.total,
+            "detected_images": self.detected,
+            "detection_rate": (self.detected / self.total) * 100 if self.total else 0.0,
+            "accuracy": (self.correct / self.verifiable) * 100 if self.verifiable else 0.0,
+            "counts": dict(self.counts),
+            "verifiable": self.verifiable,
+            "errors": self.errors,
+        }
+
+
+def evaluate_batch(
+    model,
+    images: Union[Iterable[Path], ImageCache],
+    save_dir: Path,
+    label_dir: Optional[Path] = None,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    batch_size: int = 8,
+    decode_workers: int = 2,
+    queue_depth: int = 32,
+    imgsz: Optional[int] = None,
+    annotate: str = "sync",
+    timer: Optional[StageTimer] = None,
+    table: Optional[DetectionTable] = None,
+    keep_details: bool = True,
+) -> Dict:
+    """
+    Runs predictions on a set of images and aggregates simple statistics.
+    Images are decoded by `decode_workers` threads (at most `queue_depth`
+    ahead, letterboxed to `imgsz` when given) and processed in mini-batches
+    of `batch_size`; the summary reports the resulting throughput in images/sec.
+    `annotate="none"` skips annotated copies (stats only) and `"async"` writes
+    them in the background. Passing an `ImageCache` evaluates straight from the
+    memory-mapped cache. With a `timer`, the summary also carries its per-stage
+    histograms under `timings`. A `table` collects all detections in columnar
+    form; with `keep_details=False` the per-image dicts are not kept
+    (`details` is empty), which bounds memory on large runs.
+    """
+    stats = BatchStats()
+    per_image: List[Dict] = []
+
+    start = time.perf_counter()
+    for item in iter_batch_predictions(
+        model,
+        images,
+        save_dir,
+        label_dir=label_dir,
+        conf=conf,
+        iou=iou,
+        batch_size=batch_size,
+        decode_workers=decode_workers,
+        queue_depth=queue_depth,
+        imgsz=imgsz,
+        annotate=annotate,
+        timer=timer,
+        table=table,
+    ):
+        stats.add(item)
+        if keep_details:
+            per_image.append(item)
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        **stats.summary(),
         "details": per_image,
         "output_dir": str(save_dir),
+        "annotate": annotate,
+        "batch_size": max(1, int(batch_size)),
+        "elapsed_seconds": elapsed,
+        "images_per_sec": stats.total / elapsed if elapsed > 0 else 0.0,
+    }
+    if timer is not None:
+        summary["timings"] = timer.summary()
+    return summary
+
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+def iter_image_files(root: Path, suffixes: Tuple[str, ...] = IMAGE_SUFFIXES) -> Iterator[Path]:
+    """
+    Lazily walks `root` recursively and yields image files in a stable
+    (sorted) order, one directory listing at a time.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(suffixes):
+                yield Path(dirpath) / name
+
+
+def iter_file_list(list_path: Path) -> Iterator[Path]:
+    """
+    Yields the image paths listed in a text file, one per line.
+    """
+    with open(list_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield Path(line)
+
+
+def _load_checkpoint(output_path: Path) -> set:
+    """
+    Returns the image ids already written to a JSONL output. A trailing
+    partial line (crash mid-write) is truncated so appending stays valid.
+    """
+    done = set()
+    if not output_path.exists():
+        return done
+
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(raw)["image"])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(raw)
+    if valid_bytes != output_path.stat().st_size:
+        with open(output_path, "rb+") as f:
+            f.truncate(valid_bytes)
+    return done
+
+
+def stream_predictions(
+    model,
+    images: Iterable[Path],
+    output_path: Path,
+    save_dir: Path,
+    label_dir: Optional[Path] = None,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    batch_size: int = 8,
+    decode_workers: int = 2,
+    annotate: str = "none",
+    resume: bool = True,
+    checkpoint_every: int = 256,
+    timer: Optional[StageTimer] = None,
+) -> Dict:
+    """
+    Bulk inference writing one JSON line per image (the `details` record of
+    `evaluate_batch`) to `output_path` as results complete.
+
+    Only running statistics are kept in memory. The output is flushed and
+    fsynced every `checkpoint_every` images; with `resume`, images already
+    present in an existing output are skipped, so a crashed run continues
+    where it stopped. The returned summary covers this run only.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    done = _load_checkpoint(output_path) if resume else set()
+    skipped = 0
+
+    def _pending() -> Iterator[Path]:
+        nonlocal skipped
+        for path in images:
+            if str(path) in done:
+                skipped += 1
+                continue
+            yield path
+
+    stats = BatchStats()
+    start = time.perf_counter()
+    with open(output_path, "a" if resume else "w") as out:
+        for item in iter_batch_predictions(
+            model,
+            _pending(),
+            save_dir,
+            label_dir=label_dir,
+            conf=conf,
+            iou=iou,
+            batch_size=batch_size,
+            decode_workers=decode_workers,
+            annotate=annotate,
+            timer=timer,
+        ):
+            out.write(json.dumps(item) + "\n")
+            stats.add(item)
+            if (stats.total + stats.errors) % max(1, checkpoint_every) == 0:
+                out.flush()
+                os.fsync(out.fileno())
+        out.flush()
+        os.fsync(out.fileno())
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        **stats.summary(),
+        "skipped": skipped,
+        "output_path": str(output_path),
+        "elapsed_seconds": elapsed,
+        "images_per_sec": stats.total / elapsed if elapsed > 0 else 0.0,
     }
+    if timer is not None:
+        summary["timings"] = timer.summary()
+    return summary
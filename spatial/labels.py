@@ -0,0 +1,120 @@
+"""
+Labelling engine turning Galaxy Zoo vote fractions into a single class.
+
+The notebook heuristic is expressed as NumPy boolean masks over the whole
+probability matrix, with configurable thresholds, so several threshold sets can
+be evaluated in one sweep.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+# Columns of training_solutions_rev1.csv used by the rules, in matrix order
+PROBABILITY_COLUMNS = ("Class1.1", "Class1.2", "Class1.3", "Class2.1", "Class3.1", "Class4.1")
+
+# Thresholds of the original notebook heuristic
+DEFAULT_THRESHOLDS: Dict[str, float] = {
+    "artefact": 0.4,  # Class1.3: star or artefact -> artefact
+    "edge_on": 0.5,  # Class2.1: disk seen edge-on -> profil
+    "features": 0.5,  # Class1.2: features or disk ...
+    "spiral": 0.4,  # ... and Class4.1 (arms) or Class3.1 (bar) -> spirale
+    "smooth": 0.5,  # Class1.1: smooth -> elliptique
+}
+
+_RULE_ORDER = ("artefact", "edge_on", "features", "spiral", "smooth")
+
+
+def probability_matrix(df) -> np.ndarray:
+    """
+    Extracts the (N, 6) probability matrix used by the rules from the CSV.
+    """
+    return df.loc[:, list(PROBABILITY_COLUMNS)].to_numpy(dtype=np.float32)
+
+
+def _resolve(thresholds: Optional[Dict[str, float]]) -> Dict[str, float]:
+    resolved = dict(DEFAULT_THRESHOLDS)
+    if thresholds:
+        unknown = set(thresholds) - set(DEFAULT_THRESHOLDS)
+        if unknown:
+            raise ValueError(
+                f"Unknown threshold(s) {sorted(unknown)}; expected {list(_RULE_ORDER)}"
+            )
+        resolved.update({k: float(v) for k, v in thresholds.items()})
+    return resolved
+
+
+def _label_sets(probs: np.ndarray, threshold_sets: List[Dict[str, float]]) -> np.ndarray:
+    """
+    Applies every threshold set at once by broadcasting a (S, 1) threshold
+    column against the (N,) probability columns. Returns (S, N) class ids.
+    """
+    limits = np.array(
+        [[_resolve(t)[name] for name in _RULE_ORDER] for t in threshold_sets],
+        dtype=np.float32,
+    )
+    artefact, edge_on, features, spiral, smooth = (limits[:, [i]] for i in range(5))
+    c11, c12, c13, c21, c31, c41 = probs.T
+
+    # Nothing matched: most likely of smooth / features / artefact
+    fallback = np.array([0, 1, 3])[np.argmax(probs[:, :3], axis=1)]
+    conditions = [
+        c13 > artefact,
+        c21 > edge_on,
+        (c12 > features) & ((c41 > spiral) | (c31 > spiral)),
+        c11 > smooth,
+    ]
+    choices = [np.full(conditions[0].shape, cid) for cid in (3, 2, 1, 0)]
+    default = np.broadcast_to(fallback, conditions[0].shape)
+    return np.select(conditions, choices, default=default).astype(np.int64)
+
+
+def assign_labels(probs: np.ndarray, thresholds: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """
+    Returns one class id per row of the probability matrix. Missing thresholds
+    default to `DEFAULT_THRESHOLDS`.
+    """
+    return _label_sets(probs, [thresholds or {}])[0]
+
+
+def label_histograms(
+    probs: np.ndarray,
+    threshold_sets: Iterable[Optional[Dict[str, float]]],
+    num_classes: int = 4,
+) -> List[Dict[int, int]]:
+    """
+    Evaluates several threshold sets in a single pass and returns the number
+    of samples per class for each of them.
+    """
+    sets = [t or {} for t in threshold_sets]
+    if not sets:
+        return []
+    labels = _label_sets(probs, sets)
+    counts = (labels[:, :, None] == np.arange(num_classes)).sum(axis=1)
+    return [{cid: int(n) for cid, n in enumerate(row)} for row in counts]
+
+
+def parse_thresholds(spec: Union[str, Path]) -> Union[Dict[str, float], List[Dict[str, float]]]:
+    """
+    Reads thresholds from a JSON file (an object, or a list of objects for a
+    sweep) or from an inline `name=value,name=value` string.
+    """
+    path = Path(spec)
+    if path.suffix.lower() == ".json" or path.exists():
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return [_resolve(item) for item in data]
+        return _resolve(data)
+
+    thresholds: Dict[str, float] = {}
+    for part in str(spec).split(","):
+        if not part.strip():
+            continue
+        name, sep, value = part.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid threshold {part!r}, expected name=value")
+        thresholds[name.strip()] = float(value)
+    return _resolve(thresholds)
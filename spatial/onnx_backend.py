@@ -0,0 +1,229 @@
+"""
+ONNX Runtime backend for CPU inference.
+
+`OnnxModel` runs a YOLO detector exported to ONNX with our own letterbox
+pre-processing, confidence filtering and NMS. It exposes the small part of
+the Ultralytics API the rest of the package relies on (`predict()` returning
+results with `boxes.xyxy / conf / cls` and `plot()`), so it can be used
+anywhere a `YOLO` model is.
+"""
+
+import ast
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .boxes import batched_nms
+from .data import CLASS_NAMES
+from .imaging import letterbox, read_image
+
+# Same candidate limits as the Ultralytics post-processing
+MAX_DETECTIONS = 300
+MAX_CANDIDATES = 30000
+
+
+class OnnxBoxes:
+    """
+    Detections of one image as NumPy arrays, highest confidence first.
+    """
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self) -> int:
+        return len(self.conf)
+
+
+class OnnxResult:
+    """
+    Prediction for one image, shaped like an Ultralytics result.
+    """
+
+    def __init__(
+        self,
+        orig_img: np.ndarray,
+        boxes: OnnxBoxes,
+        names: Dict[int, str],
+        speed: Dict[str, float],
+    ):
+        self.orig_img = orig_img
+        self.boxes = boxes
+        self.names = names
+        # Per-image milliseconds, same keys as Ultralytics' `res.speed`
+        self.speed = speed
+
+    def plot(self) -> np.ndarray:
+        """
+        Returns a BGR copy of the input with the detections drawn.
+        """
+        from .tiling import draw_detections
+
+        detections = [
+            {
+                "class_name": self.names.get(int(cls), str(int(cls))),
+                "confidence": float(score),
+                "box": box.tolist(),
+            }
+            for box, score, cls in zip(self.boxes.xyxy, self.boxes.conf, self.boxes.cls)
+        ]
+        return draw_detections(self.orig_img, detections)
+
+
+def _metadata(session) -> Dict:
+    meta = dict(session.get_modelmeta().custom_metadata_map)
+    for key in ("imgsz", "names", "stride"):
+        if key in meta:
+            meta[key] = ast.literal_eval(meta[key])
+    return meta
+
+
+class OnnxModel:
+    """
+    YOLO detector exported to ONNX (`yolo export format=onnx`), run with
+    onnxruntime on CPU. `threads` caps the intra-op thread pool.
+    """
+
+    def __init__(self, model_path: Path, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.model_path = Path(model_path)
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        batch, _, height, width = self.session.get_inputs()[0].shape
+
+        meta = _metadata(self.session)
+        imgsz = meta.get("imgsz", [height, width])
+        self.imgsz = int(imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz)
+        self.names: Dict[int, str] = meta.get("names", CLASS_NAMES)
+        self.end2end = meta.get("end2end") == "True"
+        # Symbolic dimensions ("batch", "height") mean the export was dynamic
+        self.max_batch = batch if isinstance(batch, int) else None
+        self.dynamic_size = not isinstance(height, int)
+
+    def _preprocess(self, frames: Sequence[np.ndarray], size: int):
+        padded = []
+        transforms = []
+        for frame in frames:
+            image, scale, pad = letterbox(frame, size)
+            padded.append(image)
+            transforms.append((scale, pad))
+        # BGR HWC uint8 -> RGB CHW float in [0, 1], whole batch at once
+        batch = np.stack(padded)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32) / 255.0, transforms
+
+    def _postprocess(
+        self, output: np.ndarray, conf: float, iou: float, max_det: int
+    ) -> List[OnnxBoxes]:
+        if self.end2end:
+            # (B, N, 6): x1, y1, x2, y2, score, class already NMS-ed
+            boxes = output[..., :4]
+            scores = output[..., 4]
+            classes = output[..., 5].astype(np.int64)
+        else:
+            # (B, 4 + classes, N): cx, cy, w, h, per-class scores
+            preds = output.transpose(0, 2, 1)
+            class_scores = preds[..., 4:]
+            classes = class_scores.argmax(axis=-1)
+            scores = np.take_along_axis(class_scores, classes[..., None], axis=-1)[..., 0]
+            cxcy, wh = preds[..., :2], preds[..., 2:4]
+            boxes = np.concatenate([cxcy - wh / 2.0, cxcy + wh / 2.0], axis=-1)
+
+        per_image = []
+        for img_boxes, img_scores, img_classes in zip(boxes, scores, classes):
+            keep = np.flatnonzero(img_scores > conf)
+            if len(keep) > MAX_CANDIDATES:
+                keep = keep[np.argsort(-img_scores[keep])[:MAX_CANDIDATES]]
+            img_boxes, img_scores, img_classes = (
+                img_boxes[keep],
+                img_scores[keep],
+                img_classes[keep],
+            )
+            if self.end2end:
+                order = np.argsort(-img_scores, kind="stable")
+            else:
+                order = batched_nms(img_boxes, img_scores, img_classes, iou)
+            order = order[:max_det]
+            per_image.append(
+                OnnxBoxes(
+                    img_boxes[order].astype(np.float32),
+                    img_scores[order].astype(np.float32),
+                    img_classes[order].astype(np.int64),
+                )
+            )
+        return per_image
+
+    def predict(
+        self,
+        source,
+        conf: float = 0.25,
+        iou: float = 0.45,
+        imgsz: Optional[int] = None,
+        max_det: int = MAX_DETECTIONS,
+        verbose: bool = False,
+        **kwargs,
+    ) -> List[OnnxResult]:
+        """
+        Same call shape as `YOLO.predict`: `source` is a path, a BGR array or
+        a list of those. Returns one result per image, boxes in pixels of the
+        original image. Unsupported Ultralytics options are ignored.
+        """
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        frames = [
+            s if isinstance(s, np.ndarray) else read_image(Path(s)) for s in sources
+        ]
+        size = int(imgsz) if imgsz and self.dynamic_size else self.imgsz
+        chunk = self.max_batch or max(1, len(frames))
+
+        results: List[OnnxResult] = []
+        for start in range(0, len(frames), chunk):
+            batch_frames = frames[start : start + chunk]
+            t0 = time.perf_counter()
+            inputs, transforms = self._preprocess(batch_frames, size)
+            t1 = time.perf_counter()
+            output = self.session.run(None, {self.input_name: inputs})[0]
+            t2 = time.perf_counter()
+            per_image = self._postprocess(output, conf, iou, max_det)
+            t3 = time.perf_counter()
+            scale_ms = 1000.0 / len(batch_frames)
+            speed = {
+                "preprocess": (t1 - t0) * scale_ms,
+                "inference": (t2 - t1) * scale_ms,
+                "postprocess": (t3 - t2) * scale_ms,
+            }
+            for frame, (scale, (left, top)), boxes in zip(batch_frames, transforms, per_image):
+                # Undo the letterbox: back to original image pixels
+                xyxy = (boxes.xyxy - np.array([left, top, left, top], dtype=np.float32)) / scale
+                h, w = frame.shape[:2]
+                xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+                xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+                boxes.xyxy = xyxy
+                results.append(OnnxResult(frame, boxes, self.names, dict(speed)))
+        return results
+
+    __call__ = predict
+
+
+def export_onnx(weights: Path, imgsz: int = 416, dest: Optional[Path] = None) -> Path:
+    """
+    Exports a `.pt` checkpoint to ONNX with a dynamic batch dimension, so
+    `OnnxModel` can run micro-batches in a single call. Returns the path of
+    the `.onnx` file (next to the weights unless `dest` is given).
+    """
+    import shutil
+
+    from ultralytics import YOLO
+
+    exported = Path(YOLO(str(weights)).export(format="onnx", imgsz=imgsz, dynamic=True))
+    if dest is not None and exported != dest:
+        shutil.move(str(exported), dest)
+        exported = dest
+    return exported
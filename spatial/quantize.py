@@ -0,0 +1,136 @@
+"""
+Post-training INT8 quantization of ONNX exports for CPU inference.
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .imaging import read_image
+
+QUANT_MODES = ("static", "dynamic")
+
+
+class _CalibrationReader:
+    """
+    Feeds letterboxed validation images, one per batch, to the onnxruntime
+    calibrator (implements its `CalibrationDataReader` protocol).
+    """
+
+    def __init__(self, model, images: Sequence[Path]):
+        self.model = model
+        self.images = iter(images)
+
+    def get_next(self) -> Optional[Dict]:
+        path = next(self.images, None)
+        if path is None:
+            return None
+        inputs, _ = self.model._preprocess([read_image(path)], self.model.imgsz)
+        return {self.model.input_name: inputs}
+
+    def rewind(self) -> None:
+        pass
+
+
+def _head_nodes(onnx_path: Path) -> List[str]:
+    """
+    Nodes of the Ultralytics detection head (the last `/model.N/` block).
+    It decodes boxes in pixels and class scores in [0, 1] into one tensor:
+    a shared INT8 scale would wipe out the scores, so it stays in float.
+    """
+    import onnx
+
+    graph = onnx.load(str(onnx_path)).graph
+    blocks = [re.match(r"^/model\.(\d+)/", node.name) for node in graph.node]
+    indices = [int(m.group(1)) for m in blocks if m]
+    if not indices:
+        return []
+    prefix = f"/model.{max(indices)}/"
+    return [node.name for node in graph.node if node.name.startswith(prefix)]
+
+
+def _copy_metadata(src: Path, dest: Path) -> None:
+    """
+    Carries the export metadata (imgsz, class names) over to the quantized
+    model so `OnnxModel` configures itself the same way.
+    """
+    import onnx
+
+    meta = {p.key: p.value for p in onnx.load(str(src)).metadata_props}
+    model = onnx.load(str(dest))
+    current = {p.key: p.value for p in model.metadata_props}
+    if not meta.keys() <= current.keys():
+        onnx.helper.set_model_props(model, {**meta, **current})
+        onnx.save(model, str(dest))
+
+
+def float_model_path(weights: Path, dest: Path) -> Path:
+    """
+    FP32 ONNX model `quantize_model(weights, dest)` quantizes: `weights`
+    itself for an `.onnx`, else its export next to `dest`.
+    """
+    weights = Path(weights)
+    if weights.suffix.lower() == ".onnx":
+        return weights
+    return Path(dest).with_name(f"{weights.stem}.onnx")
+
+
+def quantize_model(
+    weights: Path,
+    dest: Path,
+    calibration_images: Sequence[Path] = (),
+    imgsz: int = 416,
+    mode: str = "static",
+) -> Path:
+    """
+    Writes an INT8 version of `weights` (`.pt`, exported to ONNX first at
+    `float_model_path`, or an existing `.onnx`) to `dest`, loadable with
+    `load_model`.
+
+    `static` quantizes weights and activations, with activation ranges
+    calibrated on `calibration_images`; `dynamic` only quantizes weights
+    ahead of time and needs no calibration. The detection head stays in
+    float in both modes.
+    """
+    from onnxruntime.quantization import (
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    from .onnx_backend import OnnxModel, export_onnx
+
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode} (expected {QUANT_MODES})")
+
+    weights = Path(weights)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    float_path = float_model_path(weights, dest)
+    if float_path != weights:
+        float_path = export_onnx(weights, imgsz=imgsz, dest=float_path)
+
+    exclude = _head_nodes(float_path)
+    if mode == "static":
+        if not calibration_images:
+            raise ValueError("Static quantization needs calibration images")
+        quantize_static(
+            str(float_path),
+            str(dest),
+            _CalibrationReader(OnnxModel(float_path), calibration_images),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            nodes_to_exclude=exclude,
+        )
+    else:
+        quantize_dynamic(
+            str(float_path),
+            str(dest),
+            weight_type=QuantType.QUInt8,
+            nodes_to_exclude=exclude,
+        )
+    _copy_metadata(float_path, dest)
+    return dest
+
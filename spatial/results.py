@@ -0,0 +1,324 @@
+"""
+Columnar detection results for bulk runs.
+
+A `DetectionTable` keeps the detections of many images in one NumPy
+structured array (image index, class id, confidence, xyxy box) plus small
+per-image columns (image id, ground truth, error). Statistics are computed
+on the arrays directly; dicts are only built at the edges (`records`,
+`detections`) for JSON output. Tables are saved as NPZ, or as Parquet when
+pandas has a Parquet engine (pyarrow) installed.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .data import CLASS_NAMES
+
+DETECTION_DTYPE = np.dtype(
+    [
+        ("image", np.int32),
+        ("class_id", np.int16),
+        ("confidence", np.float32),
+        ("x1", np.float32),
+        ("y1", np.float32),
+        ("x2", np.float32),
+        ("y2", np.float32),
+    ]
+)
+BOX_COLUMNS = ("x1", "y1", "x2", "y2")
+# Ground truth / top-1 class of an image without a label or a detection
+NO_CLASS = -1
+
+
+class DetectionTable:
+    """
+    Detections of a set of images, filled one image at a time with `add`
+    (e.g. by `evaluate_batch(table=...)`), in input order.
+    """
+
+    def __init__(self):
+        self.images: List[str] = []
+        self._ground_truth: List[int] = []
+        self.errors: Dict[int, str] = {}
+        self._chunks: List[np.ndarray] = []
+        self._detections: Optional[np.ndarray] = np.zeros(0, dtype=DETECTION_DTYPE)
+
+    def add(
+        self,
+        image_id: str,
+        xyxy: Optional[np.ndarray] = None,
+        conf: Optional[np.ndarray] = None,
+        cls: Optional[np.ndarray] = None,
+        ground_truth: Optional[int] = None,
+        error: Optional[str] = None,
+    ) -> int:
+        """
+        Appends one image and its detections (see `result_arrays`); returns
+        the image index. An image that failed carries `error` instead.
+        """
+        index = len(self.images)
+        self.images.append(str(image_id))
+        self._ground_truth.append(NO_CLASS if ground_truth is None else int(ground_truth))
+        if error is not None:
+            self.errors[index] = str(error)
+        if conf is not None and len(conf):
+            rows = np.empty(len(conf), dtype=DETECTION_DTYPE)
+            rows["image"] = index
+            rows["class_id"] = cls
+            rows["confidence"] = conf
+            for i, column in enumerate(BOX_COLUMNS):
+                rows[column] = xyxy[:, i]
+            self._chunks.append(rows)
+            self._detections = None
+        return index
+
+    @property
+    def detections(self) -> np.ndarray:
+        """
+        All detections as a `DETECTION_DTYPE` array, by image then as predicted
+        (highest confidence first).
+        """
+        if self._detections is None:
+            self._detections = np.concatenate(self._chunks)
+            self._chunks = [self._detections]
+        return self._detections
+
+    @property
+    def ground_truth(self) -> np.ndarray:
+        """
+        Ground-truth class per image, `NO_CLASS` when unknown.
+        """
+        return np.asarray(self._ground_truth, dtype=np.int16)
+
+    @property
+    def num_images(self) -> int:
+        return len(self.images)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        images: Sequence[str],
+        detections: np.ndarray,
+        ground_truth: Optional[np.ndarray] = None,
+        errors: Optional[Dict[int, str]] = None,
+    ) -> "DetectionTable":
+        table = cls()
+        table.images = [str(image) for image in images]
+        if ground_truth is None:
+            ground_truth = np.full(len(table.images), NO_CLASS)
+        table._ground_truth = [int(v) for v in ground_truth]
+        table.errors = dict(errors or {})
+        table._detections = np.asarray(detections, dtype=DETECTION_DTYPE)
+        table._chunks = [table._detections]
+        return table
+
+    def filter(self, conf: float = 0.0) -> "DetectionTable":
+        """
+        Same images, keeping the detections with confidence above `conf`.
+        """
+        detections = self.detections
+        return DetectionTable.from_arrays(
+            self.images,
+            detections[detections["confidence"] > conf],
+            self.ground_truth,
+            self.errors,
+        )
+
+    def select(self, indices: Sequence[int]) -> "DetectionTable":
+        """
+        New table with the images at `indices`, in that order, and their
+        detections. An index given twice copies the image twice.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        detections = self.detections
+        # Detections grouped by image: each selected image is one slice
+        order = np.argsort(detections["image"], kind="stable")
+        counts = np.bincount(detections["image"], minlength=self.num_images)
+        starts = np.cumsum(counts) - counts
+        taken = counts[indices]
+        offsets = np.repeat(starts[indices] - (np.cumsum(taken) - taken), taken)
+        rows = detections[order[offsets + np.arange(taken.sum())]]
+        rows["image"] = np.repeat(np.arange(len(indices)), taken)
+        return DetectionTable.from_arrays(
+            [self.images[i] for i in indices.tolist()],
+            rows,
+            self.ground_truth[indices],
+            {k: self.errors[i] for k, i in enumerate(indices.tolist()) if i in self.errors},
+        )
+
+    def merge(self, other: "DetectionTable") -> "DetectionTable":
+        """
+        Appends the images of `other` (e.g. another shard) after these ones.
+        """
+        offset = len(self.images)
+        moved = other.detections.copy()
+        moved["image"] += offset
+        detections = np.concatenate([self.detections, moved])
+        self.images.extend(other.images)
+        self._ground_truth.extend(other._ground_truth)
+        self.errors.update({offset + i: message for i, message in other.errors.items()})
+        self._detections = detections
+        self._chunks = [detections]
+        return self
+
+    def top1(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best detection per image: class ids (`NO_CLASS` when none) and
+        confidences (NaN when none).
+        """
+        detections = self.detections
+        classes = np.full(self.num_images, NO_CLASS, dtype=np.int16)
+        scores = np.full(self.num_images, np.nan, dtype=np.float32)
+        if len(detections):
+            order = np.lexsort((-detections["confidence"], detections["image"]))
+            images, first = np.unique(detections["image"][order], return_index=True)
+            best = detections[order[first]]
+            classes[images] = best["class_id"]
+            scores[images] = best["confidence"]
+        return classes, scores
+
+    def readable(self) -> np.ndarray:
+        """
+        Mask of the images that did not fail (no entry in `errors`).
+        """
+        mask = np.ones(self.num_images, dtype=bool)
+        mask[list(self.errors)] = False
+        return mask
+
+    def summary(self) -> Dict:
+        """
+        The `BatchStats.summary()` statistics, computed on the arrays
+        (images that failed count as `errors` only).
+        """
+        readable = self.readable()
+        predicted, _ = self.top1()
+        predicted, truth = predicted[readable], self.ground_truth[readable]
+        total = len(predicted)
+        detected = int((predicted != NO_CLASS).sum())
+        verifiable = truth != NO_CLASS
+        correct = int((verifiable & (predicted == truth)).sum())
+        n_verifiable = int(verifiable.sum())
+
+        counts = {cid: 0 for cid in CLASS_NAMES.keys()}
+        ids, per_class = np.unique(predicted[predicted != NO_CLASS], return_counts=True)
+        for cid, count in zip(ids.tolist(), per_class.tolist()):
+            counts[cid] = count
+        return {
+            "total_images": total,
+            "detected_images": detected,
+            "detection_rate": (detected / total) * 100 if total else 0.0,
+            "accuracy": (correct / n_verifiable) * 100 if n_verifiable else 0.0,
+            "counts": counts,
+            "verifiable": n_verifiable,
+            "errors": len(self.errors),
+        }
+
+    def detections_of(self, index: int) -> List[Dict]:
+        """
+        Detections of one image as `detections_from_result` dicts.
+        """
+        detections = self.detections
+        rows = detections[detections["image"] == index]
+        boxes = np.stack([rows[c] for c in BOX_COLUMNS], axis=1).tolist() if len(rows) else []
+        return [
+            {
+                "class_id": cid,
+                "class_name": CLASS_NAMES.get(cid, str(cid)),
+                "confidence": score,
+                "box": box,
+            }
+            for cid, score, box in zip(
+                rows["class_id"].tolist(), rows["confidence"].tolist(), boxes
+            )
+        ]
+
+    def records(self) -> Iterator[Dict]:
+        """
+        One `evaluate_batch` detail record per image (without annotated paths).
+        """
+        predicted, scores = self.top1()
+        truth = self.ground_truth
+        for index, image in enumerate(self.images):
+            top_class = int(predicted[index])
+            record = {
+                "image": image,
+                "prediction": None if top_class == NO_CLASS else top_class,
+                "prediction_name": CLASS_NAMES.get(top_class) if top_class != NO_CLASS else None,
+                "confidence": None if top_class == NO_CLASS else float(scores[index]),
+                "ground_truth": None if truth[index] == NO_CLASS else int(truth[index]),
+            }
+            if index in self.errors:
+                record["error"] = self.errors[index]
+            yield record
+
+    def save(self, path: Path) -> Path:
+        """
+        Writes the table to `.npz` (compressed) or `.parquet` (one row per
+        detection, plus one empty row for each image without any).
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        errors = [self.errors.get(i, "") for i in range(self.num_images)]
+        if path.suffix == ".parquet":
+            self._frame(errors).to_parquet(path, index=False)
+        elif path.suffix == ".npz":
+            np.savez_compressed(
+                path,
+                images=np.asarray(self.images, dtype=str),
+                ground_truth=self.ground_truth,
+                errors=np.asarray(errors, dtype=str),
+                detections=self.detections,
+            )
+        else:
+            raise ValueError(f"Unsupported table format: {path.suffix} (use .npz or .parquet)")
+        return path
+
+    def _frame(self, errors: List[str]):
+        import pandas as pd
+
+        detections = self.detections
+        empty = np.setdiff1d(np.arange(self.num_images), detections["image"])
+        padding = np.zeros(len(empty), dtype=DETECTION_DTYPE)
+        padding["image"] = empty
+        padding["class_id"] = NO_CLASS
+        padding["confidence"] = np.nan
+        for column in BOX_COLUMNS:
+            padding[column] = np.nan
+        rows = np.concatenate([detections, padding])
+        rows = rows[np.argsort(rows["image"], kind="stable")]
+
+        frame = pd.DataFrame(rows)
+        frame.insert(1, "image_id", np.asarray(self.images, dtype=object)[rows["image"]])
+        frame.insert(2, "ground_truth", self.ground_truth[rows["image"]])
+        frame["error"] = np.asarray(errors, dtype=object)[rows["image"]]
+        return frame
+
+    @classmethod
+    def load(cls, path: Path) -> "DetectionTable":
+        path = Path(path)
+        if path.suffix == ".parquet":
+            import pandas as pd
+
+            frame = pd.read_parquet(path)
+            firsts = frame.drop_duplicates("image").sort_values("image")
+            kept = frame[frame["class_id"] != NO_CLASS]
+            detections = np.zeros(len(kept), dtype=DETECTION_DTYPE)
+            for column in DETECTION_DTYPE.names:
+                detections[column] = kept[column].to_numpy()
+            images = firsts["image_id"].tolist()
+            ground_truth = firsts["ground_truth"].to_numpy()
+            errors = firsts["error"].tolist()
+        else:
+            with np.load(path) as data:
+                images = data["images"].tolist()
+                ground_truth = data["ground_truth"]
+                errors = data["errors"].tolist()
+                detections = data["detections"]
+        return cls.from_arrays(
+            images,
+            detections,
+            ground_truth,
+            {i: message for i, message in enumerate(errors) if message},
+        )
@@ -0,0 +1,230 @@
+"""
+Raw score store: predict once at a low threshold, re-threshold offline.
+
+`ScoreStore.collect` keeps, for every image a model has seen, its candidate
+boxes above `STORE_CONF` before non-maximum suppression, in a
+`DetectionTable` file named after the SHA-256 of the model weights. Images
+are identified by the SHA-256 of their content and the inference size.
+`rethreshold` then applies any conf / iou to those candidates with the same
+rules as the model's own post-processing, so statistics for a new setting
+take seconds instead of a full inference pass.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .boxes import batched_nms
+from .evaluation import load_labels
+from .inference import iter_batch_predictions
+from .onnx_backend import MAX_DETECTIONS
+from .results import BOX_COLUMNS, DetectionTable
+from .timing import StageTimer
+
+# Candidates kept in the store: lowest confidence, no suppression (NMS keeps
+# boxes whose IoU is at most 1.0), best STORE_MAX_DET per image
+STORE_CONF = 0.001
+STORE_IOU = 1.0
+STORE_MAX_DET = 1000
+
+
+def _file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_digest(model_path: Path) -> str:
+    """
+    SHA-256 of the weights file: a retrained or re-exported model gets its
+    own scores, a copied or renamed one shares them.
+    """
+    return _file_sha256(model_path)
+
+
+def rethreshold(
+    table: DetectionTable,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    max_det: int = MAX_DETECTIONS,
+) -> DetectionTable:
+    """
+    Detections the model would have returned at `conf` / `iou`, from stored
+    candidates: confidence filter, class-aware NMS per image, then the
+    `max_det` best, for `conf` at least `STORE_CONF`.
+
+    Only the top-1 of each image, and with it every statistic built on it
+    (`summary`, `evaluate_table`), is exact: NMS never removes the best box.
+    The other boxes are approximate, and so is their count. The model
+    suppresses boxes before clipping them to the image, and the store keeps
+    only the `STORE_MAX_DET` best candidates.
+    """
+    candidates = table.filter(conf).detections
+    if len(candidates) == 0 or (iou >= STORE_IOU and max_det >= STORE_MAX_DET):
+        return DetectionTable.from_arrays(
+            table.images, candidates, table.ground_truth, table.errors
+        )
+
+    # Candidates are grouped by image: NMS runs on each contiguous slice
+    order = np.argsort(candidates["image"], kind="stable")
+    candidates = candidates[order]
+    starts = np.flatnonzero(np.diff(candidates["image"], prepend=-1))
+    ends = np.append(starts[1:], len(candidates))
+    boxes = np.stack([candidates[c] for c in BOX_COLUMNS], axis=1)
+
+    kept = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        keep = batched_nms(
+            boxes[start:end],
+            candidates["confidence"][start:end],
+            candidates["class_id"][start:end],
+            iou,
+        )
+        kept.append(start + keep[:max_det])
+    return DetectionTable.from_arrays(
+        table.images,
+        candidates[np.concatenate(kept)],
+        table.ground_truth,
+        table.errors,
+    )
+
+
+class ScoreStore:
+    """
+    Directory of raw score tables, one `<model sha256>.npz` per model.
+    Collecting new images appends to the model's table; images already
+    stored (same content, same inference size) are never predicted again.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        # (path, size, mtime) -> content SHA-256, so unchanged files are read once
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+    def image_key(self, path: Path, imgsz: Optional[int] = None) -> str:
+        """
+        Store key of an image: SHA-256 of its content and the inference size
+        (`default` for the model's own).
+        """
+        stat = Path(path).stat()
+        cached = (str(path), stat.st_size, stat.st_mtime_ns)
+        if cached not in self._hashes:
+            self._hashes[cached] = _file_sha256(path)
+        return f"{self._hashes[cached]}@{imgsz or 'default'}"
+
+    def missing(
+        self, digest: str, images: Sequence[Path], imgsz: Optional[int] = None
+    ) -> List[Path]:
+        """
+        Images of `images` without stored scores for the model `digest`.
+        """
+        stored = self.load(digest)
+        known = set(stored.images) if stored is not None else set()
+        return [Path(p) for p in images if self.image_key(p, imgsz) not in known]
+
+    def path(self, digest: str) -> Path:
+        return self.root / f"{digest}.npz"
+
+    def load(self, digest: str) -> Optional[DetectionTable]:
+        path = self.path(digest)
+        return DetectionTable.load(path) if path.exists() else None
+
+    def save(self, digest: str, table: DetectionTable) -> Path:
+        """
+        Writes the table atomically, so an interrupted run never leaves a
+        truncated store behind.
+        """
+        tmp = self.root / f"{digest}.{os.getpid()}.tmp.npz"
+        try:
+            table.save(tmp)
+            os.replace(tmp, self.path(digest))
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return self.path(digest)
+
+    def collect(
+        self,
+        model,
+        digest: str,
+        images: Sequence[Path],
+        label_dir: Optional[Path] = None,
+        batch_size: int = 8,
+        decode_workers: int = 2,
+        imgsz: Optional[int] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> Dict:
+        """
+        Raw scores of `images` for the model with weights `digest`,
+        predicting only the images missing from the store. Returns
+        {"table": candidates of `images` in input order (duplicates
+        dropped), "predicted": images run through the model, "stored":
+        images answered from the store, "failed": images that could not be
+        read}. Failed images are in the table with their error but are not
+        stored, so the next run tries them again. Ground truth is re-read
+        from `label_dir` when given.
+        """
+        images = list(dict.fromkeys(Path(p) for p in images))
+        keys = [self.image_key(p, imgsz) for p in images]
+        stored = self.load(digest) or DetectionTable()
+        known = {key: i for i, key in enumerate(stored.images)}
+        # One prediction per content: copies of an image share its scores
+        missing: Dict[str, Path] = {}
+        for key, path in zip(keys, images):
+            if key not in known:
+                missing.setdefault(key, path)
+        from_store = sum(key in known for key in keys)
+        failed = 0
+
+        if missing:
+            fresh = DetectionTable()
+            for _ in iter_batch_predictions(
+                model,
+                list(missing.values()),
+                self.root,
+                label_dir=label_dir,
+                conf=STORE_CONF,
+                iou=STORE_IOU,
+                batch_size=batch_size,
+                decode_workers=decode_workers,
+                imgsz=imgsz,
+                annotate="none",
+                timer=timer,
+                table=fresh,
+                max_det=STORE_MAX_DET,
+            ):
+                pass
+            # Error records may come out ahead of buffered images: map by id
+            key_of = {str(path): key for key, path in missing.items()}
+            fresh.images = [key_of[image] for image in fresh.images]
+            valid = [i for i in range(fresh.num_images) if i not in fresh.errors]
+            errors = sorted(fresh.errors)
+            failed = len(errors)
+            if valid:
+                known.update({fresh.images[i]: stored.num_images + k for k, i in enumerate(valid)})
+                stored.merge(fresh.select(valid))
+                self.save(digest, stored)
+            # Failed images are answered with their error, but never saved
+            known.update({fresh.images[i]: stored.num_images + k for k, i in enumerate(errors)})
+            stored.merge(fresh.select(errors))
+
+        selected = stored.select([known[key] for key in keys])
+        selected.images = [str(p) for p in images]
+        if label_dir:
+            selected = DetectionTable.from_arrays(
+                selected.images,
+                selected.detections,
+                load_labels(label_dir, [p.stem for p in images]),
+                selected.errors,
+            )
+        return {
+            "table": selected,
+            "predicted": len(missing) - failed,
+            "stored": from_store,
+            "failed": failed,
+        }
@@ -0,0 +1,491 @@
+"""
+Serving helpers: dynamic micro-batching of concurrent prediction requests,
+a bounded executor for load shedding, and the request handling shared by
+the web apps (app_flask.py, app_asgi.py).
+"""
+
+import base64
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .data import CLASS_NAMES, read_label
+from .imaging import read_image
+from .inference import ModelManager, PredictionCache
+from .timing import StageTimer
+
+# Column order of the detection rows in `compact_results`
+DETECTION_COLUMNS = ("class_id", "confidence", "x1", "y1", "x2", "y2")
+
+# Web app defaults (SPATIAL_MODEL_PATH serves other weights, see
+# `serving_model_path`)
+DEFAULT_MODEL_PATH = Path("models/galaxy_model_v2_expert.pt")
+MODELS_DIR = Path("models")
+MODEL_SUFFIXES = (".pt", ".onnx")
+VAL_IMAGES_DIR = Path("data/processed/galaxy_expert/val/images")
+VAL_LABELS_DIR = Path("data/processed/galaxy_expert/val/labels")
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+# Concurrent requests grouped into one forward pass
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT_MS = 10
+# Prediction cache (image content + model + thresholds); a directory keeps
+# it across restarts
+PREDICTION_CACHE_SIZE = 4096
+PREDICTION_CACHE_DIR: Optional[Path] = None
+# Maximum images (files or URLs) per /predict_batch call
+BATCH_MAX_IMAGES = 64
+
+
+class MicroBatcher:
+    """
+    Collects `predict()` calls arriving from concurrent threads and runs them
+    as a single forward pass.
+
+    A batch is dispatched as soon as `max_batch_size` requests are waiting or
+    `max_wait_ms` after its first request arrived. It exposes the same
+    `predict(source=..., **kwargs)` call as an Ultralytics model, so it can be
+    passed wherever a model is expected (e.g. `predict_image`). Requests with
+    different keyword arguments (conf, iou...) are batched separately.
+
+    `model_fn` is called at dispatch time, so a hot-swapped serving model is
+    picked up by the next batch. To run requests on one given model instead
+    (e.g. the one whose id keys their cached results), go through
+    `bind(model)`; requests for different models are batched separately.
+    A `timer` records, per request, the time
+    spent waiting for its batch ("queue") and the model stages of its result;
+    `stats()` then includes their summary.
+    """
+
+    def __init__(
+        self,
+        model_fn: Callable[[], object],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        timer: Optional[StageTimer] = None,
+    ):
+        self.model_fn = model_fn
+        self.timer = timer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes: Counter = Counter()
+        self._worker = threading.Thread(
+            target=self._run, name="spatial-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def predict(self, source, **kwargs) -> List:
+        """
+        Queues one image (path or BGR array), or a list of them, and blocks
+        until their batches ran. Returns one result per image, like
+        `model.predict`.
+        """
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        futures = [self.submit(item, **kwargs) for item in sources]
+        return [future.result() for future in futures]
+
+    def submit(self, source, **kwargs) -> Future:
+        """
+        Queues one image and returns a Future resolving to its result.
+        """
+        return self._submit(source, None, kwargs)
+
+    def bind(self, model) -> "BoundBatcher":
+        """
+        Same batcher, with every request run on `model` rather than on
+        `model_fn()` at dispatch time.
+        """
+        return BoundBatcher(self, model)
+
+    def _submit(self, source, model, kwargs: Dict) -> Future:
+        if isinstance(source, (str, Path)):
+            # Decode on the caller's thread so the batch worker only runs the model
+            source = read_image(Path(source))
+        kwargs.pop("verbose", None)
+        future: Future = Future()
+        self._queue.put((source, kwargs, future, time.perf_counter(), model))
+        return future
+
+    def _collect(self) -> List[Tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                self._dispatch_batch(batch)
+            except Exception as exc:
+                # Never let one bad batch kill the worker: every request still
+                # waiting gets the error instead of hanging
+                for _, _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    def _dispatch_batch(self, batch: List[Tuple]) -> None:
+        groups: Dict[Tuple, List[Tuple[object, Future, float]]] = {}
+        models: Dict[int, object] = {}
+        for source, kwargs, future, queued_at, model in batch:
+            try:
+                key = (id(model), tuple(sorted(kwargs.items())))
+                groups.setdefault(key, []).append((source, future, queued_at))
+            except TypeError as exc:
+                # Unhashable or unorderable options: only this request fails
+                future.set_exception(exc)
+                continue
+            models[id(model)] = model
+
+        for (model_key, options), items in groups.items():
+            self._dispatch(models[model_key], dict(options), items)
+
+    def _dispatch(
+        self, model, kwargs: Dict, items: List[Tuple[object, Future, float]]
+    ) -> None:
+        live = [
+            (source, future, queued_at)
+            for source, future, queued_at in items
+            if future.set_running_or_notify_cancel()
+        ]
+        if not live:
+            return
+        if self.timer is not None:
+            now = time.perf_counter()
+            for _, _, queued_at in live:
+                self.timer.record("queue", (now - queued_at) * 1000.0)
+        with self._lock:
+            self._requests += len(live)
+            self._batches += 1
+            self._batch_sizes[len(live)] += 1
+        try:
+            results = (model if model is not None else self.model_fn()).predict(
+                source=[np.ascontiguousarray(source) for source, _, _ in live],
+                verbose=False,
+                **kwargs,
+            )
+        except Exception as exc:
+            for _, future, _ in live:
+                future.set_exception(exc)
+            return
+        for (_, future, _), res in zip(live, results):
+            if self.timer is not None:
+                self.timer.record_speed(res)
+            future.set_result(res)
+
+    def stats(self) -> Dict:
+        """
+        Queue depth and batch-size metrics since startup, plus the stage
+        timings when the batcher has a timer.
+        """
+        with self._lock:
+            stats = {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": self._batches,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+        if self.timer is not None:
+            stats["timings"] = self.timer.summary()
+        return stats
+
+
+class BoundBatcher:
+    """
+    `MicroBatcher.bind(model)`: the `predict` / `submit` calls of the
+    batcher, pinned to one model.
+    """
+
+    def __init__(self, batcher: MicroBatcher, model):
+        self.batcher = batcher
+        self.model = model
+
+    predict = MicroBatcher.predict
+
+    def submit(self, source, **kwargs) -> Future:
+        return self.batcher._submit(source, self.model, kwargs)
+
+
+class Overloaded(RuntimeError):
+    """Raised by `BoundedExecutor.submit` when its queue is full."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool that admits at most `max_pending` tasks (queued + running)
+    and rejects the rest immediately with `Overloaded`, so a server can
+    answer "busy" quickly instead of letting requests pile up.
+    """
+
+    def __init__(self, workers: int = 8, max_pending: int = 32, name: str = "spatial-infer"):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise Overloaded(f"{self._pending} tasks pending (limit {self.max_pending})")
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    @property
+    def full(self) -> bool:
+        with self._lock:
+            return self._pending >= self.max_pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+
+class RequestError(Exception):
+    """
+    Invalid request, answered by the apps with `status` and `message`.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def serving_model_path() -> Path:
+    """
+    Weights served at startup: SPATIAL_MODEL_PATH, else `DEFAULT_MODEL_PATH`.
+    """
+    return Path(os.environ.get("SPATIAL_MODEL_PATH", DEFAULT_MODEL_PATH))
+
+
+class ServingState:
+    """
+    Per-app serving state: the model manager (kept warm for hot swaps), a
+    micro-batcher recording stage timings and the prediction cache.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 2,
+        cache_size: int = PREDICTION_CACHE_SIZE,
+        cache_dir: Optional[Path] = PREDICTION_CACHE_DIR,
+    ):
+        self.models = ModelManager(capacity=capacity)
+        self.batcher = MicroBatcher(
+            lambda: self.models.current,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            timer=StageTimer(),
+        )
+        self.cache = PredictionCache(
+            max_entries=cache_size,
+            disk_dir=Path(cache_dir) if cache_dir else None,
+        )
+
+    def serving(self) -> Tuple["BoundBatcher", str]:
+        """
+        Serving model (through the batcher) and its id, read together: during
+        a swap, a result is never cached under the id of another model.
+        """
+        model, model_id = self.models.snapshot()
+        return self.batcher.bind(model), model_id
+
+    def model_info(self) -> Dict:
+        """
+        Body of `GET /model`: served weights and the models kept loaded.
+        """
+        path = self.models.current_path
+        return {
+            "success": True,
+            "model": str(path) if path else None,
+            "cached": self.models.cached(),
+        }
+
+    def stats(self) -> Dict:
+        """
+        Micro-batching metrics (with stage timings) and cache hits / misses.
+        """
+        return {**self.batcher.stats(), "cache": self.cache.stats()}
+
+
+def model_candidate(name, models_dir: Path = MODELS_DIR) -> Path:
+    """
+    Weights of `models_dir` a swap request may load (`.pt` or `.onnx`, file
+    name only). Raises RequestError 400 without a name, 404 if not found.
+    """
+    if not name:
+        raise RequestError(400, "Modèle non fourni")
+    candidate = (Path(models_dir) / Path(str(name)).name).resolve()
+    if candidate.suffix not in MODEL_SUFFIXES or not candidate.exists():
+        raise RequestError(404, f"Modèle introuvable: {name}")
+    return candidate
+
+
+def random_val_image(
+    images_dir: Path = VAL_IMAGES_DIR, labels_dir: Path = VAL_LABELS_DIR
+) -> Tuple[Path, Optional[str]]:
+    """
+    Random validation image and the name of its labelled class (None when
+    unlabelled). Raises RequestError 404 when there is no image.
+    """
+    images = list(Path(images_dir).glob("*.jpg"))
+    if not images:
+        raise RequestError(404, "Aucune image de validation trouvée")
+    image = random.choice(images)
+    true_class = read_label(labels_dir, image.stem)
+    return image, None if true_class is None else CLASS_NAMES.get(true_class, "Inconnu")
+
+
+def format_result(output_jpeg: Optional[bytes], detections: Sequence[Dict]) -> Dict:
+    """
+    Single-image response in the frontend's format: annotated JPEG in
+    base64 and detections as (class name, percentage).
+    """
+    formatted = [
+        {"class": det["class_name"], "confidence": f"{det['confidence']:.2%}"}
+        for det in detections
+    ]
+    return {
+        "success": True,
+        "image": base64.b64encode(output_jpeg).decode() if output_jpeg else None,
+        "detections": formatted,
+        "count": len(formatted),
+    }
+
+
+def batch_urls(options) -> List[str]:
+    """
+    URLs of a JSON batch request. Raises RequestError 400 unless a list of
+    strings.
+    """
+    urls = options.get("urls") or []
+    if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+        raise RequestError(400, "urls doit être une liste de chaînes")
+    return urls
+
+
+def check_batch(names: Sequence[str], options) -> Tuple[bool, float, float]:
+    """
+    Validates a batch request of images `names`; returns its `batch_options`.
+    Raises RequestError 400 (no image, bad option) or 413 (too many images).
+    """
+    if not names:
+        raise RequestError(400, "Aucune image fournie")
+    if len(names) > BATCH_MAX_IMAGES:
+        raise RequestError(413, f"Maximum {BATCH_MAX_IMAGES} images par appel")
+    try:
+        return batch_options(options)
+    except ValueError:
+        raise RequestError(400, "conf et iou doivent être des nombres entre 0 et 1") from None
+
+
+def _flag(value) -> bool:
+    """
+    Boolean of a form field ('1', 'true', 'yes', 'on') or of a JSON value.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def batch_options(
+    options, conf: float = 0.10, iou: float = 0.45
+) -> Tuple[bool, float, float]:
+    """
+    (annotate, conf, iou) of a batch request, from its form fields or JSON
+    body, with `conf` / `iou` as defaults. Raises ValueError when conf or
+    iou is not a number between 0 and 1, for the apps to answer 400.
+    """
+    annotate = _flag(options.get("annotate", False))
+    try:
+        conf = float(options.get("conf", conf))
+        iou = float(options.get("iou", iou))
+    except (TypeError, ValueError):
+        raise ValueError("conf and iou must be numbers") from None
+    if not (0.0 <= conf <= 1.0 and 0.0 <= iou <= 1.0):
+        raise ValueError("conf and iou must be between 0 and 1")
+    return annotate, conf, iou
+
+
+def compact_results(
+    names: Sequence[str],
+    values: Sequence,
+    include_images: bool = False,
+) -> Dict:
+    """
+    Compact JSON body for batch predictions: class names are sent once and
+    each detection is a row of `DETECTION_COLUMNS` (confidence rounded to
+    4 digits, box to 0.1 px). `values` are `predict_many` results;
+    exceptions become per-image `error` entries. Annotated JPEGs are only
+    included (base64) with `include_images`.
+    """
+    results = []
+    for name, value in zip(names, values):
+        if isinstance(value, Exception):
+            results.append({"name": name, "error": str(value)})
+            continue
+        encoded, detections = value
+        entry: Dict = {
+            "name": name,
+            "detections": [
+                [det["class_id"], round(det["confidence"], 4)]
+                + [round(v, 1) for v in det.get("box") or ()]
+                for det in detections
+            ],
+        }
+        if include_images and encoded is not None:
+            entry["image"] = base64.b64encode(encoded).decode()
+        results.append(entry)
+    return {
+        "success": True,
+        "classes": {str(cid): name for cid, name in CLASS_NAMES.items()},
+        "columns": list(DETECTION_COLUMNS),
+        "count": len(results),
+        "results": results,
+    }
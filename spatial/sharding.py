@@ -0,0 +1,156 @@
+"""
+Multi-process sharded evaluation for CPU-only inference nodes.
+"""
+
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .inference import BatchStats, iter_batch_predictions, load_model
+from .results import DetectionTable
+from .timing import StageTimer
+
+# Per-process state: options set by `_init_worker`, model loaded by the
+# first shard (see `_worker_load`)
+_worker_model = None
+_worker_options: Dict = {}
+
+
+def _init_worker(threads: int, options: Dict) -> None:
+    global _worker_options
+    import torch
+
+    # Several processes share the machine: keep each to its slice of the cores
+    torch.set_num_threads(threads)
+    _worker_options = options
+
+
+def _worker_load():
+    """
+    Model of this worker, loaded on its first shard rather than in the pool
+    initializer: a failing load then reaches the coordinator through `imap`
+    instead of making the pool respawn workers forever.
+    """
+    global _worker_model
+    if _worker_model is None:
+        options = _worker_options
+        _worker_model = load_model(Path(options["model_path"]), threads=options["threads"])
+    return _worker_model
+
+
+def _run_shard(
+    shard: List[str],
+) -> Tuple[BatchStats, List[Dict], Optional[StageTimer], Optional[DetectionTable]]:
+    model = _worker_load()
+    options = _worker_options
+    stats = BatchStats()
+    details: List[Dict] = []
+    timer = StageTimer() if options["timings"] else None
+    table = DetectionTable() if options["table"] else None
+    for item in iter_batch_predictions(
+        model,
+        [Path(p) for p in shard],
+        Path(options["save_dir"]),
+        label_dir=Path(options["label_dir"]) if options["label_dir"] else None,
+        conf=options["conf"],
+        iou=options["iou"],
+        batch_size=options["batch_size"],
+        decode_workers=options["decode_workers"],
+        annotate=options["annotate"],
+        timer=timer,
+        table=table,
+    ):
+        stats.add(item)
+        details.append(item)
+    return stats, details, timer, table
+
+
+def evaluate_sharded(
+    model_path: Path,
+    images: Sequence[Path],
+    save_dir: Path,
+    label_dir: Optional[Path] = None,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    processes: int = 2,
+    threads_per_process: Optional[int] = None,
+    batch_size: int = 8,
+    decode_workers: int = 1,
+    annotate: str = "sync",
+    shard_size: Optional[int] = None,
+    timer: Optional[StageTimer] = None,
+    table: Optional[DetectionTable] = None,
+) -> Dict:
+    """
+    `evaluate_batch` spread over `processes` worker processes.
+
+    Each worker loads the model once and runs with `threads_per_process`
+    torch threads (default: the cores divided among workers). The image list
+    is cut into disjoint shards of `shard_size` images handed out to idle
+    workers; per-shard statistics are merged so the summary matches what
+    `evaluate_batch` reports for the same images, details in input order.
+    With a `timer`, the workers' stage timings are merged into it and
+    reported under `timings`; a `table` receives the shards' detections, in
+    input order. A model that cannot be loaded raises from the first shard.
+    """
+    if not Path(model_path).is_file():
+        raise FileNotFoundError(f"Model not found: {model_path}")
+    images = [str(p) for p in images]
+    processes = max(1, processes)
+    if threads_per_process is None:
+        threads_per_process = max(1, (os.cpu_count() or 1) // processes)
+    if shard_size is None:
+        # Several shards per worker so a slow shard does not stall the run
+        shard_size = max(batch_size, -(-len(images) // (processes * 4)))
+    shards = [images[i : i + shard_size] for i in range(0, len(images), shard_size)]
+
+    save_dir.mkdir(parents=True, exist_ok=True)
+    options = {
+        "model_path": str(model_path),
+        "threads": threads_per_process,
+        "save_dir": str(save_dir),
+        "label_dir": str(label_dir) if label_dir else None,
+        "conf": conf,
+        "iou": iou,
+        "batch_size": batch_size,
+        "decode_workers": decode_workers,
+        "annotate": annotate,
+        "timings": timer is not None,
+        "table": table is not None,
+    }
+
+    stats = BatchStats()
+    per_image: List[Dict] = []
+    start = time.perf_counter()
+    # spawn: torch does not survive fork reliably
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        processes=min(processes, max(1, len(shards))),
+        initializer=_init_worker,
+        initargs=(threads_per_process, options),
+    ) as pool:
+        for shard_stats, details, shard_timer, shard_table in pool.imap(_run_shard, shards):
+            stats.merge(shard_stats)
+            per_image.extend(details)
+            if timer is not None:
+                timer.merge(shard_timer)
+            if table is not None:
+                table.merge(shard_table)
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        **stats.summary(),
+        "details": per_image,
+        "output_dir": str(save_dir),
+        "annotate": annotate,
+        "batch_size": batch_size,
+        "processes": processes,
+        "threads_per_process": threads_per_process,
+        "elapsed_seconds": elapsed,
+        "images_per_sec": stats.total / elapsed if elapsed > 0 else 0.0,
+    }
+    if timer is not None:
+        summary["timings"] = timer.summary()
+    return summary
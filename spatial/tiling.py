@@ -0,0 +1,168 @@
+"""
+Tiled inference for wide-field sky images.
+
+The model is trained on 424px single-galaxy cutouts: a large survey frame is
+cut into overlapping tiles of that scale, the tiles are batched through the
+model and detections are merged across tile borders with a global NMS.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .boxes import batched_nms
+from .data import CLASS_NAMES
+from .imaging import read_image
+from .inference import result_arrays
+
+
+def tile_origins(length: int, tile: int, overlap: float) -> List[int]:
+    """
+    Start offsets of tiles covering [0, length) with the requested overlap
+    fraction; the last tile is aligned on the border.
+    """
+    if length <= tile:
+        return [0]
+    stride = max(1, int(round(tile * (1.0 - overlap))))
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def iter_tiles(
+    image: np.ndarray, tile_size: int = 424, overlap: float = 0.2
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """
+    Yields (x0, y0, tile) views of `image`; tiles are slices, not copies.
+    """
+    h, w = image.shape[:2]
+    for y0 in tile_origins(h, tile_size, overlap):
+        for x0 in tile_origins(w, tile_size, overlap):
+            yield x0, y0, image[y0 : y0 + tile_size, x0 : x0 + tile_size]
+
+
+def predict_tiled(
+    model,
+    source,
+    tile_size: int = 424,
+    overlap: float = 0.2,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    batch_size: int = 8,
+    regions: Optional[np.ndarray] = None,
+) -> Dict:
+    """
+    Runs the model over overlapping tiles of a large image and merges the
+    detections with a class-aware NMS over the whole frame.
+
+    `source` is a path or a BGR array. Tiles are predicted `batch_size` at a
+    time, so memory stays bounded by one batch of tiles plus the detections.
+    `regions`, an (N, 4) array of (x0, y0, w, h) crops such as the ones from
+    `detection.propose_regions`, replaces the regular tile grid. Returns the
+    detections (boxes in frame pixels) and how many tiles went through the
+    model.
+    """
+    image = source if isinstance(source, np.ndarray) else read_image(Path(source))
+    if regions is None:
+        crops = iter_tiles(image, tile_size, overlap)
+    else:
+        crops = (
+            (int(x0), int(y0), image[y0 : y0 + h, x0 : x0 + w])
+            for x0, y0, w, h in regions
+        )
+
+    boxes: List[np.ndarray] = []
+    scores: List[np.ndarray] = []
+    classes: List[np.ndarray] = []
+    tile_count = 0
+
+    def _flush(batch: List[Tuple[int, int, np.ndarray]]) -> None:
+        results = model.predict(
+            source=[np.ascontiguousarray(crop) for _, _, crop in batch],
+            conf=conf,
+            iou=iou,
+            verbose=False,
+        )
+        for (x0, y0, _), res in zip(batch, results):
+            xyxy, score, cls = result_arrays(res)
+            if len(score):
+                boxes.append(xyxy + np.array([x0, y0, x0, y0], dtype=np.float32))
+                scores.append(score)
+                classes.append(cls)
+
+    batch: List[Tuple[int, int, np.ndarray]] = []
+    for crop in crops:
+        batch.append(crop)
+        tile_count += 1
+        if len(batch) >= batch_size:
+            _flush(batch)
+            batch = []
+    if batch:
+        _flush(batch)
+
+    detections: List[Dict] = []
+    if boxes:
+        all_boxes = np.concatenate(boxes)
+        all_scores = np.concatenate(scores)
+        all_classes = np.concatenate(classes)
+        for idx in batched_nms(all_boxes, all_scores, all_classes, iou):
+            cid = int(all_classes[idx])
+            detections.append(
+                {
+                    "class_id": cid,
+                    "class_name": CLASS_NAMES.get(cid, str(cid)),
+                    "confidence": float(all_scores[idx]),
+                    "box": [float(v) for v in all_boxes[idx]],
+                }
+            )
+
+    return {
+        "detections": detections,
+        "tiles": tile_count,
+        "image_size": [int(image.shape[1]), int(image.shape[0])],
+    }
+
+
+def count_tiles(image_size: Tuple[int, int], tile_size: int = 424, overlap: float = 0.2) -> int:
+    """
+    Number of tiles `iter_tiles` would cut from a (width, height) frame.
+    """
+    width, height = image_size
+    return len(tile_origins(width, tile_size, overlap)) * len(
+        tile_origins(height, tile_size, overlap)
+    )
+
+
+def draw_detections(image: np.ndarray, detections: List[Dict]) -> np.ndarray:
+    """
+    Returns a copy of `image` with the detection boxes and labels drawn.
+    """
+    canvas = image.copy()
+    thickness = max(1, int(round(max(canvas.shape[:2]) / 1000)))
+    for det in detections:
+        x1, y1, x2, y2 = (int(round(v)) for v in det["box"])
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 255, 0), thickness)
+        cv2.putText(
+            canvas,
+            f"{det['class_name']} {det['confidence']:.2f}",
+            (x1, max(0, y1 - 4)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5 * thickness,
+            (0, 255, 0),
+            thickness,
+        )
+    return canvas
+
+
+def save_tiled_prediction(
+    image: np.ndarray, detections: List[Dict], save_dir: Path, name: str
+) -> Path:
+    """
+    Writes the annotated frame to `save_dir/<name>_tiled.jpg`.
+    """
+    save_dir.mkdir(parents=True, exist_ok=True)
+    out_path = save_dir / f"{name}_tiled.jpg"
+    cv2.imwrite(str(out_path), draw_detections(image, detections))
+    return out_path
@@ -0,0 +1,152 @@
+"""
+Optional per-stage timing instrumentation.
+
+Functions of `spatial.inference` take a `timer` argument: pass a
+`StageTimer` to record where time goes (image read, model stages, plotting,
+writing, label lookup), or leave it to None, in which case each stage costs
+a single `is None` check.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Upper bucket edges (milliseconds) of the per-stage histograms
+HISTOGRAM_EDGES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# Per-image model timings Ultralytics exposes on `res.speed`
+SPEED_STAGES = ("preprocess", "inference", "postprocess")
+# Display order; unknown stages are listed after these
+STAGE_ORDER = ("load", "read", "queue") + SPEED_STAGES + ("plot", "write", "labels")
+
+_NULL_CONTEXT = nullcontext()
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        self.buckets[bisect.bisect_left(HISTOGRAM_EDGES_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def merge(self, other: "_Histogram") -> None:
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper edge of the bucket holding the q-quantile (capped by the max).
+        """
+        target = q * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                edge = HISTOGRAM_EDGES_MS[index] if index < len(HISTOGRAM_EDGES_MS) else self.max
+                return min(edge, self.max)
+        return self.max
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": self.max,
+            "histogram": {"edges_ms": list(HISTOGRAM_EDGES_MS), "counts": list(self.buckets)},
+        }
+
+
+class StageTimer:
+    """
+    Thread-safe collector of stage durations, aggregated into fixed-bucket
+    histograms (constant memory however many images are timed).
+    `callback(stage, ms)`, if given, is also called for every measurement.
+    Timers can be merged, e.g. across shards, and pickled without the callback.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float], None]] = None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Histogram] = {}
+
+    def record(self, stage: str, ms: float) -> None:
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _Histogram()
+            histogram.add(ms)
+        if self.callback is not None:
+            self.callback(stage, ms)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000.0)
+
+    def record_speed(self, res) -> None:
+        """
+        Records the preprocess / inference / postprocess times of a result.
+        """
+        speed = getattr(res, "speed", None) or {}
+        for key in SPEED_STAGES:
+            value = speed.get(key)
+            if value is not None:
+                self.record(key, float(value))
+
+    def merge(self, other: "StageTimer") -> "StageTimer":
+        with self._lock:
+            for stage, histogram in other._stages.items():
+                self._stages.setdefault(stage, _Histogram()).merge(histogram)
+        return self
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            stages = dict(self._stages)
+        ordered = [s for s in STAGE_ORDER if s in stages]
+        ordered += sorted(s for s in stages if s not in STAGE_ORDER)
+        return {stage: stages[stage].summary() for stage in ordered}
+
+    def __getstate__(self) -> Dict:
+        return {"_stages": self._stages}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.callback = None
+        self._lock = threading.Lock()
+        self._stages = state["_stages"]
+
+
+def timed(timer: Optional[StageTimer], stage: str):
+    """
+    `timer.stage(stage)`, or a shared no-op context when timing is off.
+    """
+    return _NULL_CONTEXT if timer is None else timer.stage(stage)
+
+
+def format_timings(timings: Dict[str, Dict]) -> List[str]:
+    """
+    Table lines for a `StageTimer.summary()`, for CLI output.
+    """
+    lines = [
+        f"{'stage':<12}{'count':>8}{'mean ms':>10}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'max ms':>10}{'total s':>10}"
+    ]
+    for stage, s in timings.items():
+        lines.append(
+            f"{stage:<12}{s['count']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}"
+            f"{s['p95_ms']:>10.2f}{s['max_ms']:>10.2f}{s['total_ms'] / 1000.0:>10.2f}"
+        )
+    return lines